@@ -1,47 +1,137 @@
 from __future__ import annotations
 
+import hashlib
 import json
 import os
 import re
+import shutil
 from datetime import datetime
-from typing import Union
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import nullcontext
+from functools import cached_property, lru_cache, partial
+from typing import TYPE_CHECKING, Union
+from xml.etree import ElementTree
 
 import numpy as np
 
-import pandas as pd
-from mp_api.client import MPRester
-from pymatgen.analysis.adsorption import AdsorbateSiteFinder
 from pymatgen.core.structure import Molecule, Structure
-from pymatgen.core.surface import SlabGenerator
-from pymatgen.io.vasp.inputs import Incar, Kpoints, Poscar, Potcar
-from pymatgen.io.vasp.outputs import (BSVasprun, Chgcar, Eigenval, Outcar,
-                                      Procar, Vasprun)
-from pymatgen.symmetry.bandstructure import HighSymmKpath
-
-job_types: dict = {
-    "bulk_relaxation_low_prec": {"System": "AutoVASP Low Precision Bulk Relaxation", "PREC": "NORMAL", "ENCUT": "520", "ISTART": "0", "ICHARG": "2", "ISPIN": "1", "NELM": "60", "NELMIN": "2", "NELMDL": "10", "EDIFF": "1.0E-05", "LREAL": "Auto", "VOSKOWN": "1", "ADDGRID": ".TRUE.", "EDIFFG": "-1.0E-04", "NSW": "90", "IBRION": "2", "ISIF": "3", "SIGMA": "0.10", "ISMEAR": "0"},
-    "bulk_relaxation_med_prec": {"System": "AutoVASP Med. Precision Bulk Relaxation", "PREC": "Accurate", "ENCUT": "520", "ISTART": "0", "ICHARG": "2", "ISPIN": "1", "NELM": "60", "NELMIN": "2", "NELMDL": "10", "EDIFF": "1.0E-06", "LREAL": "Auto", "VOSKOWN": "1", "ADDGRID": ".TRUE.", "EDIFFG": "-1.0E-05", "NSW": "90", "IBRION": "2", "ISIF": "3", "SIGMA": "0.10", "ISMEAR": "0"},
-    "bulk_relaxation_high_prec": {"System": "AutoVASP High Precision Bulk Relaxation", "PREC": "Accurate", "ENCUT": "520", "ISTART": "0", "ICHARG": "2", "ISPIN": "1", "NELM": "60", "NELMIN": "3", "NELMDL": "10", "EDIFF": "1.0E-07", "LREAL": "Auto", "VOSKOWN": "1", "ADDGRID": ".TRUE.", "EDIFFG": "-1.0E-06", "NSW": "90", "IBRION": "2", "ISIF": "3", "SIGMA": "0.10", "ISMEAR": "0"},
-    "slab_relaxation_low_prec": {"System": "AutoVASP Low Precision Slab Relaxation", "PREC": "NORMAL", "ENCUT": "520", "ISTART": "0", "ICHARG": "2", "ISPIN": "1", "NELM": "60", "NELMIN": "2", "NELMDL": "10", "EDIFF": "1.0E-05", "LREAL": "Auto", "VOSKOWN": "1", "ADDGRID": ".TRUE.", "EDIFFG": "-1.0E-04", "NSW": "90", "IBRION": "2", "ISIF": "2", "SIGMA": "0.10", "ISMEAR": "0"},
-    "slab_relaxation_med_prec": {"System": "AutoVASP Med. Precision Slab Relaxation", "PREC": "Accurate", "ENCUT": "520", "ISTART": "0", "ICHARG": "2", "ISPIN": "1", "NELM": "60", "NELMIN": "2", "NELMDL": "10", "EDIFF": "1.0E-06", "LREAL": "Auto", "VOSKOWN": "1", "ADDGRID": ".TRUE.", "EDIFFG": "-1.0E-05", "NSW": "90", "IBRION": "2", "ISIF": "2", "SIGMA": "0.10", "ISMEAR": "0"},
-    "slab_relaxation_high_prec": {"System": "AutoVASP High Precision Slab Relaxation", "PREC": "Accurate", "ENCUT": "520", "ISTART": "0", "ICHARG": "2", "ISPIN": "1", "NELM": "60", "NELMIN": "3", "NELMDL": "10", "EDIFF": "1.0E-07", "LREAL": "Auto", "VOSKOWN": "1", "ADDGRID": ".TRUE.", "EDIFFG": "-1.0E-06", "NSW": "90", "IBRION": "2", "ISIF": "2", "SIGMA": "0.10", "ISMEAR": "0"},
-    "spin_orbit": {"SYSTEM": "Spin-Orbit Coupling Calculation", "LSORBIT": ".TRUE.", "GGA_COMPAT": ".FALSE.", "VOSKOWN": "1", "LMAXMIX": "4", "ISYM": "-1", "NBANDS": "set_bands_manually", "LORBIT": "11", "EDIFF":"1.06E-06"},
-    "dos": {"System": "AutoVASP Density of States", "ISPIN": "1", "PREC": "Accurate", "NSW": "0", "ISMEAR": "-5", "ENCUT": "520", "NEDOS": "5000", "LORBIT": "11", "EMIN": "-10", "EMAX": "8"},
-    "band": {"System": "AutoVASP Band Structure Calculation", "ICHARG": "11", "ENCUT": "520", "ISMEAR": "0", "SIGMA": "0.1", "LORBIT": "11"},
-    "mBJ": {"SYSTEM": "AutoVASP generated MBJ", "METAGGA": "MBJ", "CMBJ": "1.2", "LASPH": ".TRUE.", "LWAVE": ".TRUE.", "LCHARG": ".TRUE.", "LELF": ".TRUE.", "LORBIT": "11", "LSORBIT": ".TRUE.", "ENCUT": "520", "EDIFF": "1E-7", "LREAL": ".False.", "ISTART": "0", "ISYM": "-1", "NELMIN": "8"},
-    "bdcd": {"SYSTEM": "Band Decomposed Charge Densiy", "LPARD": ".TRUE."}
-}
-
-
-def structure_from_mpi_code(mpcode: str, api_key: str) -> Structure:
+
+from IncarConfig import load_job_types, validate_incar_dict
+from symmetry import symmetry_info
+from volumetric import VolumetricGrid
+
+# pandas, mp_api, the surface/adsorption/symmetry modules and all of pymatgen.io.vasp are imported where they are used,
+# so short scripts that only read and write structures do not pay for them on every start
+# (importing pymatgen.io.vasp.inputs runs the package __init__, which also imports the output parsers)
+if TYPE_CHECKING:
+    import pandas as pd
+    from pymatgen.core.surface import Slab
+    from pymatgen.io.vasp.inputs import Incar, Kpoints, Poscar, Potcar
+    from pymatgen.io.vasp.outputs import Chgcar, Eigenval, Outcar, Procar, Vasprun
+
+    from store import StructureStore
+
+# job templates live in resources/jobTemplates.json, bases are resolved and every template is validated on import
+job_types: dict = load_job_types()
+
+
+# Materials Project structures are kept here so later calls (e.g. on compute nodes) work offline
+mp_cache_dir: str = os.environ.get("AUTOVASP_MP_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "autovasp", "mp"))
+
+
+def _mp_code(mpcode: str) -> str:
+    mpcode = str(mpcode)
+    if not mpcode.startswith("mp-"):
+        mpcode = "mp-"+mpcode
+
+    return mpcode
+
+
+def _mp_cache_file(mpcode: str, cache_dir: Union[str, None] = None) -> str:
+    return os.path.join(cache_dir if cache_dir is not None else mp_cache_dir, mpcode + ".json")
+
+
+def _cache_mp_structure(mpcode: str, structure: Structure, cache_dir: Union[str, None] = None) -> None:
+    filename = _mp_cache_file(mpcode, cache_dir)
+    os.makedirs(os.path.dirname(filename), exist_ok=True)
+    temporary_file = f"{filename}.{os.getpid()}.tmp"
+    with open(temporary_file, "w") as f:
+        json.dump(structure.as_dict(), f)
+    os.replace(temporary_file, filename)
+
+
+def structures_from_mpi_codes(mpcodes: list[str], api_key: Union[str, None] = None, cache_dir: Union[str, None] = None, client=None, offline: bool = False) -> dict[str, Structure]:
+    '''
+    Creates pymatgen structures (conventional cells) for several codes, keyed on the "mp-" prefixed code
+    Codes found in the local cache are served from disk, all others are fetched in a single request and then cached
+    client can replace the MPRester session, offline=True raises instead of contacting the Materials Project
+    '''
+    mpcodes = [_mp_code(mpcode) for mpcode in mpcodes]
+
+    structures = {}
+    for mpcode in mpcodes:
+        filename = _mp_cache_file(mpcode, cache_dir)
+        if os.path.exists(filename):
+            with open(filename, "r") as f:
+                structures[mpcode] = Structure.from_dict(json.load(f))
+
+    missing = [mpcode for mpcode in dict.fromkeys(mpcodes) if mpcode not in structures]
+    if missing and offline:
+        raise ValueError(f"{missing} not found in the Materials Project cache and offline is set")
+
+    if missing:
+        from mp_api.client import MPRester
+        from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+
+        session = nullcontext(client) if client is not None else MPRester(api_key)
+        with session as mpr:
+            docs = mpr.materials.summary.search(material_ids=missing, fields=["material_id", "structure"])
+
+        for doc in docs:
+            mpcode = str(doc.material_id)
+            structure = SpacegroupAnalyzer(doc.structure).get_conventional_standard_structure()
+            _cache_mp_structure(mpcode, structure, cache_dir)
+            structures[mpcode] = structure
+
+        not_found = [mpcode for mpcode in missing if mpcode not in structures]
+        if not_found:
+            raise ValueError(f"{not_found} not found on the Materials Project")
+
+    return {mpcode: structures[mpcode] for mpcode in mpcodes}
+
+
+def seed_mp_cache(bundle: str, cache_dir: Union[str, None] = None) -> list[str]:
+    '''
+    Fills the Materials Project cache from a bundle so no network access is needed
+    bundle is either a JSON file mapping codes to structure dictionaries, or a directory of <code>.cif / <code>.json files
+    Returns the codes that were added
+    '''
+    structures = {}
+    if os.path.isdir(bundle):
+        for filename in sorted(os.listdir(bundle)):
+            mpcode, extension = os.path.splitext(filename)
+            if extension == ".cif":
+                structures[mpcode] = Structure.from_file(os.path.join(bundle, filename))
+            elif extension == ".json":
+                with open(os.path.join(bundle, filename), "r") as f:
+                    structures[mpcode] = Structure.from_dict(json.load(f))
+    else:
+        with open(bundle, "r") as f:
+            structures = {mpcode: Structure.from_dict(structure) for mpcode, structure in json.load(f).items()}
+
+    for mpcode, structure in structures.items():
+        _cache_mp_structure(_mp_code(mpcode), structure, cache_dir)
+
+    return [_mp_code(mpcode) for mpcode in structures]
+
+
+def structure_from_mpi_code(mpcode: str, api_key: str, cache_dir: Union[str, None] = None, client=None) -> Structure:
     '''
     Creates a pymatgen structure from a code
     '''
-    if not mpcode.startswith("mp-"):
-        mpcode = "mp-"+mpcode
+    mpcode = _mp_code(mpcode)
 
-    with MPRester(api_key) as mpr:
-        structure = mpr.get_structure_by_material_id(mpcode, conventional_unit_cell=True)
+    structure = structures_from_mpi_codes([mpcode], api_key, cache_dir=cache_dir, client=client)[mpcode]
 
     return structure
 
@@ -68,30 +158,144 @@ def addAdsorbate(structure: Structure, adsorbate: Molecule, min_z: float = 5.0,
     '''
     Finds all adsorption sites on a structure and adsorbs the adsorbate at each site. Returns a list of adsorbed structures.
     '''
+    from pymatgen.analysis.adsorption import AdsorbateSiteFinder
 
     asf = AdsorbateSiteFinder(structure)
     ads_structs = asf.generate_adsorption_structures(adsorbate, repeat=coverage, find_args={"distance": distance})  # edit later
 
     for ads_struct in ads_structs:
-        for site in ads_struct:
-            if site.z < min_z:
-                site.properties["selective_dynamics"] = [False, False, False]
-            else:
-                site.properties["selective_dynamics"] = [True, True, True]
+        ads_struct.add_site_property("selective_dynamics", selective_dynamics_mask(ads_struct.cart_coords[:, 2], min_z).tolist())
 
     return ads_structs
 
 
-def slabs_from_structure(structure: Structure, miller_index: list[int], min_slab_size: float = 15.0, min_vacuum_size: float = 15.0, use_in_unit_planes: bool = False, ensure_symmetric_slabs: bool = True, min_z: int = 5) -> list[Structure]:
+def symmetry_unique_sites(structure: Structure, sites: list[np.ndarray], symprec: float = 0.1, threshold: float = 0.1) -> list[np.ndarray]:
     '''
-    Function to generate slabs from a structure
+    Removes symmetry-equivalent adsorption sites (Cartesian coordinates) using the symmetry operations of structure
+    The operations are found once and applied to each candidate site in a single array operation
+    Sites closer than threshold (Angst) to an image of a kept site are equivalent, so the tolerance does not depend on the cell (e.g. the vacuum of a slab)
+    '''
+    operations = symmetry_info(structure, symprec).analyzer.get_symmetry_operations()
+    rotations = np.array([op.rotation_matrix for op in operations])
+    translations = np.array([op.translation_vector for op in operations])
+
+    unique_sites: list[np.ndarray] = []
+    unique_frac = np.empty((0, 3))
+    for site in sites:
+        frac_coords = structure.lattice.get_fractional_coords(site)
+        images = rotations @ frac_coords + translations
+        difference = images[:, None, :] - unique_frac[None, :, :]
+        difference -= np.round(difference)
+        if not (np.linalg.norm(difference @ structure.lattice.matrix, axis=-1) < threshold).any():
+            unique_sites.append(site)
+            unique_frac = np.vstack([unique_frac, frac_coords])
+
+    return unique_sites
+
+
+def _name_adsorbates(adsorbates: list[Molecule]) -> dict[str, Molecule]:
     '''
+    Keys a list of adsorbates on their formulas without counts of one (e.g. H2O, CH4), raises a ValueError if two adsorbates share a formula
+    '''
+    named: dict[str, Molecule] = {}
+    for adsorbate in adsorbates:
+        name = re.sub(r"(?<![0-9])1(?![0-9])", "", adsorbate.composition.formula.replace(" ", ""))
+        if name in named:
+            raise ValueError(f"ERROR: More than one adsorbate with the formula {name}, pass a dictionary to name them")
+        named[name] = adsorbate
+
+    return named
+
+
+def adsorb_many(structure: Structure, adsorbates: Union[list[Molecule], dict[str, Molecule]], min_z: float = 5.0, coverage: list[int] = [1, 1, 1], distance: float = 1.0,
+                positions: tuple[str, ...] = ("ontop", "bridge", "hollow"), symprec: float = 0.1, threshold: float = 0.1) -> dict[str, list[Structure]]:
+    '''
+    Places several adsorbates on one shared list of symmetry-unique adsorption sites
+    Sites of all types are deduplicated together, so each inequivalent configuration is only generated once
+    Returns a dictionary of adsorbed structures keyed on the adsorbate name (the formula if a list is given)
+    '''
+    if not isinstance(adsorbates, dict):
+        adsorbates = _name_adsorbates(adsorbates)
+
+    from pymatgen.analysis.adsorption import AdsorbateSiteFinder
+
+    asf = AdsorbateSiteFinder(structure)
+    sites = asf.find_adsorption_sites(distance=distance, positions=positions, symm_reduce=0)["all"]
+    sites = symmetry_unique_sites(asf.slab, sites, symprec=symprec, threshold=threshold)
+
+    adsorbed: dict[str, list[Structure]] = {}
+    for name, adsorbate in adsorbates.items():
+        adsorbed[name] = []
+        for site in sites:
+            ads_struct = asf.add_adsorbate(adsorbate, site, repeat=coverage)
+            ads_struct.add_site_property("selective_dynamics", selective_dynamics_mask(ads_struct.cart_coords[:, 2], min_z).tolist())
+            adsorbed[name].append(ads_struct)
+
+    return adsorbed
+
+
+# site properties that make otherwise identical structures different jobs
+fingerprinted_properties: tuple[str, ...] = ("selective_dynamics", "magmom")
+
+
+def structure_fingerprint(structure: Structure, decimals: int = 4) -> str:
+    '''
+    Returns a sha256 hash of the lattice, species, fractional coordinates and fingerprinted site properties (selective dynamics, magnetic moments) of a structure
+    Coordinates are wrapped into the cell and rounded, and sites are sorted, so the hash does not depend on site order
+    Structures without these site properties hash as before they were included
+    '''
+    lattice = np.round(structure.lattice.matrix, decimals) + 0.0
+    frac_coords = np.round(np.mod(np.round(structure.frac_coords, decimals), 1.0), decimals) + 0.0
+    columns = [[str(site.species) for site in structure], map(tuple, frac_coords.tolist())]
+    for name in fingerprinted_properties:
+        if name in structure.site_properties:
+            values = structure.site_properties[name]
+            columns.append([json.dumps(None if value is None else (np.round(np.asarray(value, dtype=float), decimals) + 0.0).tolist()) for value in values])
+    sites = sorted(zip(*columns))
+    canonical = json.dumps([lattice.tolist(), sites])
+
+    return hashlib.sha256(canonical.encode()).hexdigest()
+
+
+def may_be_symmetric(slab: Structure, tolerance: float = 0.2) -> bool:
+    '''
+    Cheap necessary condition for Slab.is_symmetric: the (species, height) profile must be unchanged when the slab is flipped
+    Any operation that maps the top surface onto the bottom one reflects the heights about the middle of the slab
+    '''
+    # unwrap the fractional heights so the slab is contiguous (the largest gap is the vacuum)
+    z = np.sort(np.mod(slab.frac_coords[:, 2], 1.0))
+    gaps = np.diff(np.concatenate([z, [z[0] + 1]]))
+    start = z[(np.argmax(gaps) + 1) % len(z)]
+    heights = np.mod(slab.frac_coords[:, 2] - start, 1.0) * slab.lattice.volume / np.linalg.norm(np.cross(slab.lattice.matrix[0], slab.lattice.matrix[1]))
+    flipped = heights.max() + heights.min() - heights
+
+    species = np.array([str(site.species) for site in slab])
+    for element in np.unique(species):
+        if not np.allclose(np.sort(heights[species == element]), np.sort(flipped[species == element]), atol=tolerance):
+            return False
+
+    return True
+
+
+def _generate_slabs(structure: Structure, miller_index: list[int], min_slab_size: float, min_vacuum_size: float, use_in_unit_planes: bool, ensure_symmetric_slabs: bool) -> list[Structure]:
+    from pymatgen.core.surface import SlabGenerator
 
     slab_generator = SlabGenerator(initial_structure=structure, miller_index=miller_index, min_slab_size=min_slab_size,
                                    min_vacuum_size=min_vacuum_size, primitive=False, in_unit_planes=use_in_unit_planes)
     slabs = slab_generator.get_slabs()
     if ensure_symmetric_slabs:
-        slabs = [slab for slab in slabs if slab.is_symmetric()]
+        # skip the spglib check for slabs that cannot be symmetric
+        slabs = [slab for slab in slabs if may_be_symmetric(slab) and slab.is_symmetric()]
+
+    return slabs
+
+
+def slabs_from_structure(structure: Structure, miller_index: list[int], min_slab_size: float = 15.0, min_vacuum_size: float = 15.0, use_in_unit_planes: bool = False, ensure_symmetric_slabs: bool = True, min_z: int = 5) -> list[Structure]:
+    '''
+    Function to generate slabs from a structure
+    '''
+
+    slabs = _generate_slabs(structure, miller_index, min_slab_size, min_vacuum_size, use_in_unit_planes, ensure_symmetric_slabs)
 
     if len(slabs) == 0:
         raise ValueError("No slabs generated, consider changing the slab parameters or change ensure_symmetric_slabs to False")
@@ -100,37 +304,117 @@ def slabs_from_structure(structure: Structure, miller_index: list[int], min_slab
 
     # freeze the bottom layer
     for slab in slabs:
-        slab = freeze_structure(slab, min_z)
+        freeze_structure(slab, min_z)
 
     return slabs
 
 
+def slabs_for_indices(structure: Structure, indices: list[list[int]], workers: int = 1, cache_dir: Union[str, None] = None, min_slab_size: float = 15.0, min_vacuum_size: float = 15.0,
+                      use_in_unit_planes: bool = False, ensure_symmetric_slabs: bool = True, min_z: int = 5) -> dict[tuple[int, ...], list[Structure]]:
+    '''
+    Generates slabs for several Miller indices in parallel, returns a dictionary keyed on the Miller index
+    With cache_dir, the slabs of each index are stored on disk keyed on the structure fingerprint and the slab parameters,
+    so only indices (or parameters) that have not been computed before are generated again
+    Unlike slabs_from_structure, an index without slabs gives an empty list instead of an error
+    '''
+    parameters = {"min_slab_size": min_slab_size, "min_vacuum_size": min_vacuum_size, "use_in_unit_planes": use_in_unit_planes, "ensure_symmetric_slabs": ensure_symmetric_slabs}
+    indices = [tuple(index) for index in indices]
+
+    slabs: dict[tuple[int, ...], list[Structure]] = {}
+    cache_files = {}
+    if cache_dir is not None:
+        from monty.json import MontyEncoder
+        from pymatgen.core.surface import Slab
+
+        os.makedirs(cache_dir, exist_ok=True)
+        key = structure_fingerprint(structure) + json.dumps(parameters, sort_keys=True)
+        key = hashlib.sha256(key.encode()).hexdigest()
+        for index in indices:
+            cache_files[index] = os.path.join(cache_dir, f"{key}_{'_'.join(str(i) for i in index)}.json")
+            if os.path.exists(cache_files[index]):
+                with open(cache_files[index], "r") as f:
+                    slabs[index] = [Slab.from_dict(slab) for slab in json.load(f)]
+
+    to_generate = [index for index in indices if index not in slabs]
+    generate = partial(_generate_slabs, structure, **parameters)
+    if workers > 1 and len(to_generate) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            generated = list(executor.map(generate, to_generate))
+    else:
+        generated = [generate(index) for index in to_generate]
+
+    for index, index_slabs in zip(to_generate, generated):
+        slabs[index] = index_slabs
+        if cache_dir is not None:
+            with open(cache_files[index], "w") as f:
+                json.dump([slab.as_dict() for slab in index_slabs], f, cls=MontyEncoder)
+
+    for index in indices:
+        for slab in slabs[index]:
+            freeze_structure(slab, min_z)
+
+    return {index: slabs[index] for index in indices}
+
+
 def extend_structure(structure, x_repeat: int = 1, y_repeat: int = 1 , z_repeat: int = 1) -> Structure:
     '''
     Extends a structure in the x, y, and z directions
     '''
 
-    transformation_matrix = np.array([x_repeat, 0, 0], [0, y_repeat, 0], [0, 0, z_repeat])
+    transformation_matrix = np.array([[x_repeat, 0, 0], [0, y_repeat, 0], [0, 0, z_repeat]])
 
     structure.make_supercell(transformation_matrix)
 
     return structure
 
 
-def freeze_structure(structure: Structure, min_z: float, dof: list[bool] = [False, False, False]) -> Structure:
+def selective_dynamics_mask(z: np.ndarray, min_z: Union[float, None] = None, dof: list[bool] = [False, False, False], n_layers: Union[int, None] = None, layer_tolerance: float = 0.5) -> np.ndarray:
     '''
-    Freezes the bottom layer of a structure
+    Returns an (N, 3) boolean selective dynamics array, frozen sites get dof and all others are free to move
+    z can be Cartesian or fractional z coordinates, or an (N, 3) coordinate array whose last column is used
+    Sites below min_z are frozen, or the bottom n_layers layers (sites within layer_tolerance of each other share a layer)
+    layer_tolerance is in the units of z, so layers should be grouped on Cartesian heights
+    '''
+    z = np.asarray(z, dtype=float)
+    if z.ndim == 2:
+        z = z[:, 2]
+    if (min_z is None) == (n_layers is None):
+        raise ValueError("Exactly one of min_z and n_layers must be given")
+
+    if n_layers is not None:
+        order = np.argsort(z, kind="stable")
+        layer = np.empty(len(z), dtype=int)
+        layer[order] = np.concatenate([[0], np.cumsum(np.diff(z[order]) > layer_tolerance)])
+        frozen = layer < n_layers
+    else:
+        frozen = z < min_z
+
+    mask = np.ones((len(z), 3), dtype=bool)
+    mask[frozen] = dof
+
+    return mask
+
+
+def freeze_structure(structure: Union[Structure, Poscar], min_z: Union[float, None] = None, dof: list[bool] = [False, False, False], fractional: bool = False,
+                     n_layers: Union[int, None] = None, layer_tolerance: float = 0.5) -> Union[Structure, Poscar]:
+    '''
+    Freezes the bottom layer of a structure (or the structure of a Poscar) in place
+    min_z is Cartesian unless fractional is True, alternatively n_layers freezes the bottom n layers
+    Layers are always found from Cartesian heights, as layer_tolerance is in Angst
     '''
     # if not isinstance(min_z, float) or not isinstance(min_z, int) or min_z <= 0:
     #     raise TypeError("The min_z argument must be a positive, non-zero float or integer value.")
     if not isinstance(dof, list) or not all(isinstance(x, bool) for x in dof) or len(dof) != 3:
         raise TypeError("The dof argument must be a list of booleans with length 3.")
 
-    for site in structure:
-        if site.z < min_z:
-            site.properties["selective_dynamics"] = dof
-        else:
-            site.properties["selective_dynamics"] = [True, True, True]
+    target = structure if isinstance(structure, Structure) else structure.structure
+    z = target.frac_coords[:, 2] if fractional and n_layers is None else target.cart_coords[:, 2]
+    mask = selective_dynamics_mask(z, min_z, dof, n_layers=n_layers, layer_tolerance=layer_tolerance)
+
+    if isinstance(structure, Structure):
+        structure.add_site_property("selective_dynamics", mask.tolist())
+    else:
+        structure.selective_dynamics = mask.tolist()
 
     return structure
 
@@ -139,6 +423,8 @@ def structure_to_dataframe(structure: Structure) -> pd.DataFrame:
     '''
     Converts a pymatgen structure to a pandas dataframe
     '''
+    import pandas as pd
+
     formula = structure.composition.reduced_formula
     a = structure.lattice.a
     b = structure.lattice.b
@@ -159,26 +445,103 @@ def structure_to_dataframe(structure: Structure) -> pd.DataFrame:
 
     data = {"formula": formula, "a": a, "b": b, "c": c, "alpha": alpha, "beta": beta, "gamma": gamma, "volume": volume,
             "num_species": num_species, "num_sites": num_sites, "frozen": frozen, "k_x": k_x, "k_y": k_y, "k_z": k_z}
+
     df = pd.DataFrame(data, index=[0])
 
     return df
 
 
-def recommended_kpoints(structure: Structure) -> dict:
+def plan_kpoints(lattices: np.ndarray, density: Union[float, list[float]] = 50, laue_orders: Union[np.ndarray, None] = None,
+                 method: str = "lengths") -> dict[str, np.ndarray]:
+    '''
+    Plans Gamma centred k-meshes for a batch of lattices given as an (N, 3, 3) array of lattice vectors (rows, in Angst)
+    method="lengths" gives ceil(density / a_i), the meshes make_kpoints writes by default
+    method="reciprocal" gives ceil(density * |b_i|) with b_i the reciprocal vectors without the 2 pi, the same for orthogonal cells and denser for oblique ones
+    The irreducible count is estimated as (mesh points + time reversal invariant points) / order of the Laue group,
+    laue_orders defaults to 2 (time reversal only), which is exact without other symmetry
+    Returns the integer meshes (N, 3), the number of k-points of each mesh (N,) and the estimated irreducible k-points (N,)
+    '''
+    lattices = np.asarray(lattices, dtype=float).reshape(-1, 3, 3)
+    density = np.asarray(density, dtype=float)
+    if method == "lengths":
+        divisions = np.ceil(density / np.linalg.norm(lattices, axis=2))
+    elif method == "reciprocal":
+        # the rows of inv(L).T are the reciprocal vectors, their lengths are |a_j x a_k| / V
+        reciprocal_lengths = np.linalg.norm(np.linalg.inv(lattices).transpose(0, 2, 1), axis=2)
+        divisions = np.ceil(np.round(reciprocal_lengths * density, 8))
+    else:
+        raise ValueError("method must be either 'lengths' or 'reciprocal'")
+    mesh = np.maximum(divisions, 1).astype(int)
+
+    return {"mesh": mesh, "n_kpoints": mesh.prod(axis=1), "n_irreducible": irreducible_kpoints(mesh, laue_orders)}
+
+
+def irreducible_kpoints(mesh: np.ndarray, laue_orders: Union[np.ndarray, int, None] = None) -> np.ndarray:
+    '''
+    Estimates the irreducible k-points of Gamma centred meshes given as an (N, 3) array, see plan_kpoints
+    '''
+    mesh = np.asarray(mesh, dtype=int).reshape(-1, 3)
+    n_kpoints = mesh.prod(axis=1)
+    # points with k = -k: Gamma and, along even divisions, the zone boundary
+    n_invariant = np.where(mesh % 2 == 0, 2, 1).prod(axis=1)
+    laue_orders = np.full(len(mesh), 2) if laue_orders is None else np.asarray(laue_orders)
+
+    return np.maximum(np.ceil((n_kpoints + n_invariant) / laue_orders), 1).astype(int)
+
+
+def laue_group_order(structure: Structure, symprec: float = 0.01) -> int:
+    '''
+    Returns the order of the point group of a structure combined with inversion (time reversal)
+    '''
+    rotations = {tuple(np.round(op.rotation_matrix, 6).ravel()) for op in symmetry_info(structure, symprec).analyzer.get_point_group_operations()}
+    rotations |= {tuple(-np.array(rotation)) for rotation in rotations}
+
+    return len(rotations)
+
+
+def plan_structure_kpoints(structures: list[Structure], density: Union[float, list[float]] = 50, symmetry: bool = False, method: str = "lengths") -> pd.DataFrame:
+    '''
+    Plans the k-meshes of a batch of structures with plan_kpoints, one row per structure, so candidates can be ranked by cost before writing files
+    With symmetry, the irreducible estimate uses the Laue group of every structure instead of time reversal only
+    '''
+    import pandas as pd
+
+    lattices = np.array([structure.lattice.matrix for structure in structures]).reshape(-1, 3, 3)
+    laue_orders = np.array([laue_group_order(structure) for structure in structures]) if symmetry else None
+    plan = plan_kpoints(lattices, density, laue_orders, method)
+
+    df = pd.DataFrame(plan["mesh"], columns=["k_x", "k_y", "k_z"])
+    df["formula"] = [structure.composition.reduced_formula for structure in structures]
+    df["n_kpoints"] = plan["n_kpoints"]
+    df["n_irreducible"] = plan["n_irreducible"]
+
+    return df[["formula", "k_x", "k_y", "k_z", "n_kpoints", "n_irreducible"]]
+
+
+def recommended_kpoints(structure: Structure, density: Union[float, list[float]] = 50, method: str = "lengths") -> dict:
     '''
     Returns recommended kpoints for a structure
     '''
-    k_x, k_y, k_z = 50/structure.lattice.a, 50/structure.lattice.b, 50/structure.lattice.c
+    k_x, k_y, k_z = plan_kpoints(structure.lattice.matrix, density, method=method)["mesh"][0].tolist()
     kpoints = {"kpoints": [k_x, k_y, k_z]}
     return kpoints
 
 
-def make_kpoints(structure: Structure, scale: list[float] = [50, 50, 50], force_gamma: bool = True) -> Kpoints:
+def make_kpoints(structure: Structure, scale: list[float] = [50, 50, 50], force_gamma: bool = True, method: str = "lengths") -> Kpoints:
     '''
     Creates a pymatgen Kpoints object, scales the kpoints by length of the lattice vectors
+    method="reciprocal" uses the reciprocal lattice vectors instead (see plan_kpoints), the default keeps the meshes of existing workflows
+    Without force_gamma, Monkhorst-Pack is only used for even meshes of cells that are neither hexagonal nor face centred, as in pymatgen
     '''
+    from pymatgen.io.vasp.inputs import Kpoints
+
+    mesh = tuple(plan_kpoints(structure.lattice.matrix, scale, method=method)["mesh"][0].tolist())
 
-    kpoints = Kpoints.automatic_density_by_lengths(structure, scale, force_gamma=force_gamma)
+    gamma = force_gamma or any(k % 2 == 1 for k in mesh) or structure.lattice.is_hexagonal() or symmetry_info(structure).symbol[0] == "F"
+    style = Kpoints.supported_modes.Gamma if gamma else Kpoints.supported_modes.Monkhorst
+    comment = f"k-point density of {scale}/[a, b, c]" if method == "lengths" else f"k-point density of {scale} x |b_i|"
+
+    kpoints = Kpoints(comment, 0, style, [mesh], (0, 0, 0))
     return kpoints
 
 
@@ -186,6 +549,8 @@ def make_poscar(structure: Structure, sort: bool = True) -> Poscar:
     '''
     Creates a pymatgen Poscar object
     '''
+    from pymatgen.io.vasp.inputs import Poscar
+
     poscar = Poscar(structure, sort_structure=sort)
 
     return poscar
@@ -205,45 +570,126 @@ def make_potcar(structure: Structure) -> Potcar:
         if element in recommended_potential_dict:
             elements[i] = recommended_potential_dict[element]
 
-    potcar = Potcar(elements)
+    potcar = potcar_from_symbols(tuple(elements))
 
     return potcar
 
 
+@lru_cache(maxsize=None)
+def potcar_from_symbols(symbols: tuple[str, ...]) -> Potcar:
+    '''
+    Creates a Potcar object for an ordered tuple of potential symbols, e.g. ("Bi_d", "Se")
+    Results are cached for the lifetime of the process, so the returned object is shared and should not be modified
+    '''
+    from pymatgen.io.vasp.inputs import Potcar
+
+    return Potcar(list(symbols))
+
+
+@lru_cache(maxsize=None)
+def potcar_text(symbols: tuple[str, ...]) -> str:
+    '''
+    Returns the serialised POTCAR for an ordered tuple of potential symbols, cached like potcar_from_symbols
+    '''
+    return str(potcar_from_symbols(symbols))
+
+
+def write_text_file(filename: str, text: str, buffer_size: int = 1 << 20) -> None:
+    '''
+    Writes a string to a file in one buffered write
+    '''
+    with open(filename, "w", buffering=buffer_size) as f:
+        f.write(text)
+
+
+def link_potcar(potcar: Potcar, directory: str, potcar_store: str, link: str = "hard") -> str:
+    '''
+    Writes a POTCAR once to a shared store directory and links it into directory
+    link can be "hard" or "symlink", a copy is written if the link cannot be made (e.g. across file systems)
+    '''
+    if link not in ("hard", "symlink"):
+        raise ValueError("link must be either 'hard' or 'symlink'")
+
+    if not os.path.exists(potcar_store):
+        os.makedirs(potcar_store, exist_ok=True)
+
+    stored_file = os.path.join(potcar_store, "POTCAR_" + "_".join(potcar.symbols))
+    if not os.path.exists(stored_file):
+        # write to a temporary name first so concurrent writers never see a partial file
+        temporary_file = f"{stored_file}.{os.getpid()}.tmp"
+        potcar.write_file(temporary_file)
+        os.replace(temporary_file, stored_file)
+
+    target = os.path.join(directory, "POTCAR")
+    if os.path.lexists(target):
+        os.remove(target)
+
+    try:
+        if link == "hard":
+            os.link(stored_file, target)
+        else:
+            os.symlink(os.path.abspath(stored_file), target)
+    except OSError:
+        shutil.copyfile(stored_file, target)
+
+    return target
+
+
 def make_incar(parameter_dictionary: dict) -> Incar:
     '''
     Makes an Incar object from a structure
     '''
+    from pymatgen.io.vasp.inputs import Incar
+
     incar = Incar(parameter_dictionary)
     return incar
 
 
-def make_kpath(structure: Structure, divisions: int = 40) -> Kpoints:
+@lru_cache(maxsize=1024)
+def _incar_text(items: tuple) -> str:
+    from pymatgen.io.vasp.inputs import Incar
+
+    return str(Incar(dict(items)))
+
+
+def incar_text(parameter_dictionary: dict) -> str:
+    '''
+    Returns the serialised INCAR for a parameter dictionary
+    The text is rendered once per distinct dictionary (e.g. once per job template) and reused for every job after that
+    '''
+    try:
+        return _incar_text(tuple(parameter_dictionary.items()))
+    except TypeError:
+        # unhashable values (e.g. a MAGMOM list) are rendered every time
+        return str(make_incar(parameter_dictionary))
+
+
+def make_kpath(structure: Structure, divisions: int = 40, filename: Union[str, None] = None) -> Kpoints:
     '''
     Makes a linemode Kpoints object from a structure
+    Optionally writes it to filename
     '''
+    from pymatgen.io.vasp.inputs import Kpoints
+    from pymatgen.symmetry.bandstructure import HighSymmKpath
+
     kpath = HighSymmKpath(structure)
     kpoints = Kpoints.automatic_linemode(divisions, kpath)
-    kpoints.write_file("KPATH.av")
+    if filename is not None:
+        kpoints.write_file(filename)
 
     return kpoints
 
 
 def check_for_valid_tags(dict):
     '''
-    Checks to see if the dictionary has valid tags
+    Checks to see if the dictionary has valid tags (and valid values for tags with known types)
     '''
-    # tags file is a text file with all the valid tags found in the resources folder
-    with open("resources/tags.txt", "r") as f:
-        valid_tags = f.read().splitlines()
-    # check to see if the dictionary has valid tags
     # print all invalid tags
-    for key in dict:
-        if key not in valid_tags:
-            print(key, "is not a valid tag")
-            return False
-        else:
-            return True
+    problems = validate_incar_dict(dict, raise_error=False)
+    for problem in problems:
+        print(problem)
+
+    return not problems
 
 
 def incar_dict_from_incar_file(file: str) -> dict:
@@ -310,13 +756,16 @@ def update_incar_dict(incar_dict: dict, update_dict: dict) -> dict:
     return incar_dict
 
 
-def create_readme(structure: Structure, directory: str):
+def create_readme(structure: Structure, directory: str, space_group: Union[str, None] = None):
+
+    if space_group is None:
+        space_group = symmetry_info(structure).symbol
 
     with open(directory + "/README.txt", "w") as f:
         f.write("This directory contains the input files for a VASP calculation created by AutoVASP\n")
         f.write(f"The date and time of creation is {datetime.now()} \n")
         f.write(f"The structure is {structure.composition.reduced_formula}\n")
-        f.write(f"The space group is {structure.get_space_group_info()[0]}\n")
+        f.write(f"The space group is {space_group}\n")
         f.write(f"The lattice parameters are {structure.lattice.abc} and angles are {structure.lattice.angles}\n")
 
 
@@ -360,21 +809,33 @@ class vaspInput:
         self.parameter_dictionary: dict = parameter_dictionary
         self.poscar: Poscar
         self.potcar: Potcar
-        self.incar: Incar
         self.kpoints: Kpoints
-        self.kpath: Union[Kpoints, None]
-        self.data = Union[pd.DataFrame, None]
+        self.data: Union[pd.DataFrame, None] = None
         self.initialize_files()
 
     def initialize_files(self):
         '''
         Initializes the input files
+        The Incar object, the k-path and the space group are computed lazily, the first time they are needed
         '''
         self.poscar = make_poscar(self.structure)
         self.potcar = make_potcar(self.structure)
-        self.incar = make_incar(self.parameter_dictionary)
         self.kpoints = make_kpoints(self.structure)
-        self.kpath = make_kpath(self.structure)
+        self.__dict__.pop("incar", None)
+        self.__dict__.pop("kpath", None)
+        self.__dict__.pop("space_group_info", None)
+
+    @cached_property
+    def incar(self) -> Incar:
+        return make_incar(self.parameter_dictionary)
+
+    @cached_property
+    def kpath(self) -> Union[Kpoints, None]:
+        return make_kpath(self.structure)
+
+    @cached_property
+    def space_group_info(self) -> tuple[str, int]:
+        return symmetry_info(self.structure).space_group_info
 
     def make_input_files(self, updated_parameter_dictionary: Union[dict, None] = None) -> dict:
         '''
@@ -387,9 +848,7 @@ class vaspInput:
         else:
             incar = make_incar(self.parameter_dictionary)
 
-        structure = self.structure
-        input_files = init_vasp_input_files(structure)
-        input_files["incar"] = incar
+        input_files = {"poscar": self.poscar, "potcar": self.potcar, "kpoints": self.kpoints, "kpath": self.kpath, "incar": incar}
 
         return input_files
 
@@ -399,6 +858,8 @@ class vaspInput:
         '''
         Creates a vaspInput object from a directory
         '''
+        from pymatgen.io.vasp.inputs import Incar, Poscar
+
         parameter_dictionary = Incar.from_file(directory + "/INCAR").as_dict()
         structure = Poscar.from_file(directory + "/POSCAR").structure
         vasp_input = cls(structure, parameter_dictionary)
@@ -409,108 +870,394 @@ class vaspInput:
         '''
         Returns a dataframe of the input files
         '''
+        import pandas as pd
+
         formula = self.structure.composition.reduced_formula
         a, b, c = self.structure.lattice.abc
         alpha, beta, gamma = self.structure.lattice.angles
         volume = self.structure.volume
         num_species = len(self.structure.composition.elements)
-        sym_symbol, intl_number = self.structure.get_space_group_info()
+        sym_symbol, intl_number = self.space_group_info
         k_x, k_y, k_z = self.kpoints.kpts[0]  # type: ignore
         n_kpoints = self.kpoints.num_kpts
 
         data = {"formula": formula, "a": a, "b": b, "c": c, "alpha": alpha, "beta": beta, "gamma": gamma, "volume": volume,
                 "num_species": num_species, "sym_symbol": sym_symbol, "intl_number": intl_number, "k_x": k_x, "k_y": k_y, "k_z": k_z, "n_kpoints": n_kpoints}
+
         df = pd.DataFrame(data, index=[0])
 
         return df
 
-    def write_input_files(self, directory: str, readme: bool = False) -> None:
+    def render_input_files(self, include_potcar: bool = True) -> dict[str, str]:
+        '''
+        Returns the text of each input file keyed on its file name
+        The pre-rendered INCAR of the parameter dictionary is used unless the Incar object has been created (and possibly changed)
+        '''
+        incar = str(self.incar) if "incar" in self.__dict__ else incar_text(self.parameter_dictionary)
+        files = {"POSCAR": str(self.poscar), "INCAR": incar, "KPOINTS": str(self.kpoints)}
+        if include_potcar:
+            files["POTCAR"] = potcar_text(tuple(self.potcar.symbols))
+        if self.kpath is not None:
+            files["KPATH"] = str(self.kpath)
+
+        return files
+
+    def write_input_files(self, directory: str, readme: bool = False, potcar_store: Union[str, None] = None, link: str = "hard") -> None:
         '''
         Writes input files to a directory
         Optionally writes a README.txt file and initial_parameters.csv file
+        If potcar_store is given, each unique POTCAR is written there once and hard linked (or symlinked) into the directory
         '''
 
         # make the directory if it doesn't exist
         if not os.path.exists(directory):
             os.makedirs(directory)
 
-        self.poscar.write_file(directory + "/POSCAR")
-        self.incar.write_file(directory + "/INCAR")
-        self.potcar.write_file(directory + "/POTCAR")
-        self.kpoints.write_file(directory + "/KPOINTS")
-        if self.kpath is not None:
-            self.kpath.write_file(directory + "/KPATH")
+        for filename, text in self.render_input_files(include_potcar=potcar_store is None).items():
+            write_text_file(directory + "/" + filename, text)
+        if potcar_store is not None:
+            link_potcar(self.potcar, directory, potcar_store, link=link)
 
         if readme:
-            create_readme(self.structure, directory)
+            create_readme(self.structure, directory, space_group=self.space_group_info[0])
             self.as_dataframe().to_csv(directory + "/initial_parameters.csv")
 
         return None
 
 
+def _copy_file(source: str, destination: str) -> None:
+    '''
+    Copies a file in the kernel: a reflink (copy-on-write clone) when the file system supports it, otherwise copy_file_range
+    '''
+    with open(source, "rb") as src, open(destination, "wb") as dst:
+        try:
+            import fcntl
+            fcntl.ioctl(dst.fileno(), 0x40049409, src.fileno())  # FICLONE
+            return
+        except (ImportError, OSError):
+            pass
+
+        try:
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+            return
+        except (AttributeError, OSError):
+            src.seek(0)
+            dst.seek(0)
+            dst.truncate()
+            shutil.copyfileobj(src, dst, 1 << 24)
+
+
+# files a VASP run writes in place, staging them as links would let the follow-up run overwrite the outputs of the parent run
+vasp_written_files: frozenset = frozenset({"CHG", "CHGCAR", "WAVECAR", "WAVEDER", "vasprun.xml", "OUTCAR", "OSZICAR", "CONTCAR", "DOSCAR",
+                                           "EIGENVAL", "PROCAR", "LOCPOT", "ELFCAR", "PARCHG", "XDATCAR", "IBZKPT", "PCDAT", "REPORT"})
+
+
+def _same_copy(source: str, destination: str) -> bool:
+    '''
+    Checks if destination is an identical staged copy of source (same size and modification time)
+    A link to the source is not a copy, so it is replaced by one
+    '''
+    if os.path.islink(destination) or not os.path.exists(destination) or os.path.samefile(source, destination):
+        return False
+    source_stat, destination_stat = os.stat(source), os.stat(destination)
+
+    return source_stat.st_size == destination_stat.st_size and source_stat.st_mtime_ns == destination_stat.st_mtime_ns
+
+
+def stage_file(source: str, destination: str, mode: str = "copy") -> str:
+    '''
+    Stages a file for a follow-up calculation without copying it through Python
+    mode is "copy" (reflink or in-kernel copy), "hard" (hard link) or "symlink"
+    VASP rewrites files like CHGCAR and WAVECAR in place, so files in vasp_written_files are copied in every mode and only read-only inputs
+    (POTCAR, KPOINTS, ...) are linked
+    Files that are already staged and identical are skipped, in copy mode a link to the source is replaced by a copy, returns what was done
+    '''
+    if mode not in ("copy", "hard", "symlink"):
+        raise ValueError("mode must be one of 'copy', 'hard' or 'symlink'")
+
+    if not os.path.exists(source):
+        print(f"WARNING: {source} does not exist and was not staged")
+        return "missing"
+
+    if os.path.basename(destination) in vasp_written_files:
+        mode = "copy"
+
+    if mode == "symlink":
+        if os.path.islink(destination) and os.path.realpath(destination) == os.path.realpath(source):
+            return "skipped"
+    elif mode == "hard":
+        if os.path.exists(destination) and not os.path.islink(destination) and os.path.samefile(source, destination):
+            return "skipped"
+    elif _same_copy(source, destination):
+        return "skipped"
+
+    if os.path.lexists(destination):
+        os.remove(destination)
+
+    if mode == "hard":
+        try:
+            os.link(source, destination)
+            return "hard"
+        except OSError:
+            pass
+    elif mode == "symlink":
+        os.symlink(os.path.abspath(source), destination)
+        return "symlink"
+
+    _copy_file(source, destination)
+    shutil.copystat(source, destination)
+
+    return "copy"
+
+
+def stage_files(source_directory: str, destination_directory: str, files: dict[str, str], mode: str = "copy") -> dict[str, str]:
+    '''
+    Stages several files, files maps source names to destination names (e.g. {"CONTCAR": "POSCAR"})
+    '''
+    if not os.path.exists(destination_directory):
+        os.makedirs(destination_directory)
+
+    staged = {}
+    for source_name, destination_name in files.items():
+        staged[destination_name] = stage_file(os.path.join(source_directory, source_name), os.path.join(destination_directory, destination_name), mode=mode)
+
+    return staged
+
+
+def _parse_varray(element) -> list[list[float]]:
+    return [[float(x) for x in v.text.split()] for v in element.findall("v")]
+
+
+def read_vasprun_summary(filename: str) -> dict:
+    '''
+    Reads the final structure, final energy and k-point mesh from a vasprun.xml file in a single streaming pass
+    Elements are discarded as soon as they have been read, so eigenvalues, DOS and projections are never kept in memory
+    '''
+    species: list[str] = []
+    divisions = None
+    n_kpoints = 0
+    final_structure = None
+    last_structure = None
+    final_energy = float("inf")
+    n_ionic_steps = 0
+    scstep_energy: dict = {}
+
+    # tags whose children are still needed when the tag itself is read
+    keep_children = {"structure", "atominfo", "kpoints", "energy"}
+    root = None
+    parents: list[str] = []
+    for event, element in ElementTree.iterparse(filename, events=("start", "end")):
+        if event == "start":
+            if root is None:
+                root = element
+            parents.append(element.tag)
+            continue
+
+        parents.pop()
+        tag = element.tag
+        parent = parents[-1] if parents else None
+
+        if tag == "array" and element.get("name") == "atoms" and parent == "atominfo":
+            species = [rc.find("c").text.strip() for rc in element.iter("rc")]
+        elif tag == "v" and element.get("name") == "divisions" and parent == "generation":
+            divisions = tuple(int(x) for x in element.text.split())
+        elif tag == "varray" and element.get("name") == "kpointlist" and parent == "kpoints":
+            n_kpoints = len(element.findall("v"))
+        elif tag == "structure":
+            lattice = _parse_varray(element.find("crystal/varray[@name='basis']"))
+            positions = _parse_varray(element.find("varray[@name='positions']"))
+            last_structure = (lattice, positions)
+            if element.get("name") == "finalpos":
+                final_structure = last_structure
+        elif tag == "energy" and parent == "scstep":
+            scstep_energy = {i.get("name"): float(i.text) for i in element.findall("i")}
+        elif tag == "energy" and parent == "calculation":
+            energy = {i.get("name"): float(i.text) for i in element.findall("i")}
+            n_ionic_steps += 1
+            final_energy = energy["e_0_energy"]
+            # same correction pymatgen applies for the e_0_energy bug in vasprun.xml
+            if scstep_energy:
+                corrected = np.round(scstep_energy["e_0_energy"] - scstep_energy["e_fr_energy"] + energy["e_fr_energy"], 8)
+                if np.abs(final_energy - corrected) > 1e-7:
+                    final_energy = float(corrected)
+
+        if not keep_children.intersection(parents):
+            element.clear()
+        if len(parents) == 1:
+            root.clear()  # type: ignore
+
+    if final_structure is None:
+        # unfinished runs have no finalpos block, use the last ionic step instead
+        final_structure = last_structure
+    if final_structure is None:
+        raise ValueError(f"No structure found in {filename}")
+
+    structure = Structure(final_structure[0], species, final_structure[1])
+    summary = {"final_structure": structure, "final_energy": final_energy, "kpoint_divisions": divisions,
+               "n_kpoints": n_kpoints, "num_sites": structure.num_sites, "n_ionic_steps": n_ionic_steps}
+
+    return summary
+
+
 class vaspOutput:
     '''
     A class that reads VASP output files
+    Files are only parsed the first time the corresponding attribute is accessed
     '''
 
     def __init__(self, directory: str) -> None:
         self.directory = directory
-
-        # create a vaspInput object
-        self.incar = Incar.from_file(directory + "/INCAR")
-        self.poscar = Poscar.from_file(directory + "/POSCAR")
-        self.potcar = Potcar.from_file(directory + "/POTCAR")
-        self.kpoints = Kpoints.from_file(directory + "/KPOINTS")
-        self.kpath = Kpoints.from_file(directory + "/KPATH")
-        self.initial_structure = self.poscar.structure
-        self.final_structure = Poscar.from_file(directory + "/CONTCAR").structure
-        self.outcar: Outcar
-        self.chgcar: Chgcar
-        self.eigenval: Eigenval
-        self.vasprun: Vasprun
-        self.procar: Procar
-        self.bsvasprun: BSVasprun
-        self.doscar: str  # pymatgen does not have a Doscar class
         self.data = None
 
-    def from_directory(self, directory: str) -> list:
+    @cached_property
+    def incar(self) -> Incar:
+        from pymatgen.io.vasp.inputs import Incar
 
-        outcar = Outcar(directory + "/OUTCAR")
-        chgcar = Chgcar.from_file(directory + "/CHGCAR")
-        eigenval = Eigenval(directory + "/EIGENVAL")
-        vasprun = Vasprun(directory + "/vasprun.xml")
-        procar = Procar(directory + "/PROCAR")
-        bsvasprun = BSVasprun(directory + "/vasprun.xml")
-        doscar = directory + "/DOSCAR"
+        return Incar.from_file(self.directory + "/INCAR")
 
-        # update vaspOutput object
-        self.outcar = outcar
-        self.chgcar = chgcar
-        self.eigenval = eigenval
-        self.vasprun = vasprun
-        self.procar = procar
-        self.bsvasprun = bsvasprun
-        self.doscar = doscar
+    @cached_property
+    def poscar(self) -> Poscar:
+        from pymatgen.io.vasp.inputs import Poscar
 
-        return [outcar, chgcar, eigenval, vasprun, procar, bsvasprun, doscar]
+        return Poscar.from_file(self.directory + "/POSCAR")
 
-    def as_dataframe(self) -> pd.DataFrame:
+    @cached_property
+    def potcar(self) -> Potcar:
+        from pymatgen.io.vasp.inputs import Potcar
+
+        return Potcar.from_file(self.directory + "/POTCAR")
+
+    @cached_property
+    def kpoints(self) -> Kpoints:
+        from pymatgen.io.vasp.inputs import Kpoints
+
+        return Kpoints.from_file(self.directory + "/KPOINTS")
+
+    @cached_property
+    def kpath(self) -> Kpoints:
+        from pymatgen.io.vasp.inputs import Kpoints
+
+        return Kpoints.from_file(self.directory + "/KPATH")
+
+    @cached_property
+    def initial_structure(self) -> Structure:
+        return self.poscar.structure
+
+    @cached_property
+    def final_structure(self) -> Structure:
+        from pymatgen.io.vasp.inputs import Poscar
+
+        return Poscar.from_file(self.directory + "/CONTCAR").structure
+
+    @cached_property
+    def outcar(self) -> Outcar:
+        from pymatgen.io.vasp.outputs import Outcar
+
+        return Outcar(self.directory + "/OUTCAR")
+
+    @cached_property
+    def ionic_steps(self) -> np.ndarray:
+        '''
+        Energy, max force, drift and stress of every ionic step from a single streaming pass over OUTCAR
+        '''
+        from outcar import OutcarStream
+
+        return OutcarStream(self.directory + "/OUTCAR").read()
+
+    @cached_property
+    def chgcar(self) -> Chgcar:
+        from pymatgen.io.vasp.outputs import Chgcar
+
+        return Chgcar.from_file(self.directory + "/CHGCAR")
+
+    @cached_property
+    def chgcar_grid(self) -> VolumetricGrid:
+        '''
+        Indexed CHGCAR reader that avoids the full Chgcar parse (planar averages, slices, sidecar)
+        '''
+        return VolumetricGrid(self.directory + "/CHGCAR")
+
+    @cached_property
+    def eigenval(self) -> Eigenval:
+        from pymatgen.io.vasp.outputs import Eigenval
+
+        return Eigenval(self.directory + "/EIGENVAL")
+
+    @cached_property
+    def vasprun(self) -> Vasprun:
+        from pymatgen.io.vasp.outputs import Vasprun
+
+        return Vasprun(self.directory + "/vasprun.xml")
+
+    @cached_property
+    def procar(self) -> Procar:
+        from pymatgen.io.vasp.outputs import Procar
+
+        return Procar(self.directory + "/PROCAR")
+
+    @property
+    def bsvasprun(self) -> Vasprun:
+        '''
+        Band structure data comes from the same parse as vasprun (BSVasprun only skips the DOS)
+        '''
+        return self.vasprun
+
+    @property
+    def doscar(self) -> str:
+        # pymatgen does not have a Doscar class
+        return self.directory + "/DOSCAR"
+
+    def from_directory(self, directory: Union[str, None] = None) -> list:
+        '''
+        Loads all output files and returns them as a list
+        '''
+        if directory is not None and directory != self.directory:
+            # cached files belong to the old directory
+            self.__dict__.clear()
+            self.directory = directory
+            self.data = None
+
+        return [self.outcar, self.chgcar, self.eigenval, self.vasprun, self.procar, self.bsvasprun, self.doscar]
+
+    @cached_property
+    def summary(self) -> dict:
+        return read_vasprun_summary(self.directory + "/vasprun.xml")
+
+    def as_dataframe(self, full_parse: bool = False) -> pd.DataFrame:
         '''
         Creates a pandas dataframe of the output files
+        By default only the summary of vasprun.xml is read, set full_parse to use a complete Vasprun parse
         '''
-        formula = self.vasprun.final_structure.composition.reduced_formula
-        a, b, c = self.vasprun.final_structure.lattice.abc
-        alpha, beta, gamma = self.vasprun.final_structure.lattice.angles
-        volume = self.vasprun.final_structure.volume
-        num_species = len(self.vasprun.final_structure.composition.elements)
-        sym_symbol, intl_number = self.vasprun.final_structure.get_space_group_info()
-        k_x, k_y, k_z = self.vasprun.kpoints.kpts
-        n_kpoints = self.vasprun.kpoints.num_kpts
-        energy = self.vasprun.final_energy
-        energy_per_atom = self.vasprun.final_energy / self.vasprun.final_structure.num_sites
+        import pandas as pd
+
+        if full_parse:
+            final_structure = self.vasprun.final_structure
+            divisions = self.vasprun.kpoints.kpts[0] if self.vasprun.kpoints.style.name != "Reciprocal" else None
+            n_kpoints = len(self.vasprun.actual_kpoints)
+            energy = self.vasprun.final_energy
+        else:
+            final_structure = self.summary["final_structure"]
+            divisions = self.summary["kpoint_divisions"]
+            n_kpoints = self.summary["n_kpoints"]
+            energy = self.summary["final_energy"]
+
+        formula = final_structure.composition.reduced_formula
+        a, b, c = final_structure.lattice.abc
+        alpha, beta, gamma = final_structure.lattice.angles
+        volume = final_structure.volume
+        num_species = len(final_structure.composition.elements)
+        sym_symbol, intl_number = symmetry_info(final_structure).space_group_info
+        k_x, k_y, k_z = divisions if divisions is not None else (None, None, None)
+        energy_per_atom = energy / final_structure.num_sites
 
         data = {"formula": formula, "a": a, "b": b, "c": c, "alpha": alpha, "beta": beta, "gamma": gamma, "volume": volume, "num_species": num_species,
                 "sym_symbol": sym_symbol, "intl_number": intl_number, "k_x": k_x, "k_y": k_y, "k_z": k_z, "n_kpoints": n_kpoints, "energy": energy, "energy_per_atom": energy_per_atom}
+
         df = pd.DataFrame(data, index=[0])
 
         return df
@@ -523,20 +1270,32 @@ class vaspOutput:
 
         return compare_structures(self.initial_structure, self.final_structure)
 
-    def to_csv(self):
+    def results_dataframe(self) -> pd.DataFrame:
         '''
-        Writes the output files to a csv file
+        Returns the output dataframe joined with the structural changes
         '''
+        import pandas as pd
 
         df = self.as_dataframe()
+
         df = df.join(pd.DataFrame(self.structure_changes(), index=[0]))
+
+        return df
+
+    def to_csv(self):
+        '''
+        Writes the output files to a csv file
+        '''
+
+        df = self.results_dataframe()
         df.to_csv(self.directory + "/output.csv")
 
         return None
 
-    def prepare_dos_directory(self, lobster: bool = False):
+    def prepare_dos_directory(self, lobster: bool = False, mode: str = "copy") -> dict[str, str]:
         '''
         Creates a directory that will be used for a DOS calculation
+        See stage_file for the staging modes
         '''
 
         # create the directory
@@ -545,39 +1304,23 @@ class vaspOutput:
         if lobster:
             dos_directory += "_lobster"
 
-        if not os.path.exists(dos_directory):
-            os.makedirs(dos_directory)
+        # CONTCAR becomes DOS/POSCAR
+        files_to_copy = {"CONTCAR": "POSCAR", "vasprun.xml": "vasprun.xml", "KPOINTS": "KPOINTS", "CHGCAR": "CHGCAR", "WAVECAR": "WAVECAR", "POTCAR": "POTCAR"}
 
-        # copy CONTAR to DOS/POSCAR
-        os.system("cp " + self.directory + "/CONTCAR " + dos_directory + "/POSCAR")
+        return stage_files(self.directory, dos_directory, files_to_copy, mode=mode)
 
-        # copy the vasprun.xml file using os.system
-        files_to_copy = ["vasprun.xml", "KPOINTS", "CHGCAR", "WAVECAR", "POTCAR"]
-        for file in files_to_copy:
-            os.system("cp " + self.directory + "/" + file + " " + dos_directory + "/" + file)
-
-        return None
-
-    def prepare_band_directory(self) -> None:
+    def prepare_band_directory(self, mode: str = "copy") -> dict[str, str]:
         '''
         Prepares a directory for a band structure calculation
+        See stage_file for the staging modes
         '''
 
-        # create the directory
-
         band_directory = self.directory + "/BAND"
-        if not os.path.exists(band_directory):
-            os.makedirs(band_directory)
-
-        # copy CONTAR to BAND/POSCAR
-        os.system("cp " + self.directory + "/CONTCAR " + band_directory + "/POSCAR")
 
-        # copy the vasprun.xml file using os.system
-        files_to_copy = ["vasprun.xml", "KPOINTS", "CHGCAR", "WAVECAR", "POTCAR"]
-        for file in files_to_copy:
-            os.system("cp " + self.directory + "/" + file + " " + band_directory + "/" + file)
+        # CONTCAR becomes BAND/POSCAR
+        files_to_copy = {"CONTCAR": "POSCAR", "vasprun.xml": "vasprun.xml", "KPOINTS": "KPOINTS", "CHGCAR": "CHGCAR", "WAVECAR": "WAVECAR", "POTCAR": "POTCAR"}
 
-        return None
+        return stage_files(self.directory, band_directory, files_to_copy, mode=mode)
 
 
 def make_directory_name(structure: Structure, incar_type: str) -> str:
@@ -590,24 +1333,92 @@ def make_directory_name(structure: Structure, incar_type: str) -> str:
     return directory_name
 
 
-def write_job_files(structure: Structure, incar_type: str, save_dir: str = "./", readme: bool = False) -> None:
+def write_job_files(structure: Structure, incar_type: str, save_dir: str = "./", readme: bool = False, potcar_store: Union[str, None] = None,
+                    store: Union[StructureStore, None] = None, duplicates: str = "skip") -> str:
     '''
     Creates a directory and populates it with input files for a VASP calculation
+    If a StructureStore is given and it already holds the same structure for this job type, nothing is written:
+    duplicates="skip" leaves save_dir alone and duplicates="alias" makes save_dir a symlink to the existing job
+    The structure is removed from the store again if writing the files fails
+    Returns the directory holding the job files
     '''
+    if duplicates not in ("skip", "alias"):
+        raise ValueError("duplicates must be either 'skip' or 'alias'")
 
     param_dict = job_types[incar_type]
-    input = vaspInput(structure, param_dict)
-    input.write_input_files(save_dir, readme=readme)
 
-    return None
+    if store is not None:
+        existing = store.register(structure, os.path.abspath(save_dir), tag=incar_type)
+        if existing != os.path.abspath(save_dir):
+            print(f"{save_dir} duplicates the {incar_type} job in {existing}, no files written")
+            if duplicates == "alias" and not os.path.lexists(save_dir.rstrip("/")):
+                os.makedirs(os.path.dirname(os.path.abspath(save_dir.rstrip("/"))), exist_ok=True)
+                os.symlink(existing, save_dir.rstrip("/"))
+            return existing
+
+    try:
+        input = vaspInput(structure, param_dict)
+        input.write_input_files(save_dir, readme=readme, potcar_store=potcar_store)
+    except Exception:
+        # a failed job must not own the structure, or later copies would be skipped as its duplicates
+        if store is not None:
+            store.unregister(structure, os.path.abspath(save_dir), tag=incar_type)
+        raise
+
+    return save_dir
+
+
+def _write_job(job: tuple, readme: bool = False, potcar_store: Union[str, None] = None, store: Union[StructureStore, None] = None) -> dict:
+    '''
+    Writes a single (structure, job_type, directory) job and returns its manifest row
+    '''
+    structure, incar_type, directory = job
+    row = {"directory": directory, "job_type": incar_type, "formula": structure.composition.reduced_formula,
+           "num_sites": structure.num_sites, "files": None, "status": "written", "duplicate_of": None, "error": None}
+    try:
+        written = write_job_files(structure, incar_type, directory, readme=readme, potcar_store=potcar_store, store=store)
+        if written != directory:
+            row["status"] = "duplicate"
+            row["duplicate_of"] = written
+        else:
+            row["files"] = ",".join(sorted(os.listdir(directory)))
+    except Exception as error:
+        row["status"] = "failed"
+        row["error"] = f"{type(error).__name__}: {error}"
+
+    return row
+
+
+def write_job_batch(jobs: list[tuple[Structure, str, str]], workers: int = 1, readme: bool = False, potcar_store: Union[str, None] = None,
+                    store: Union[StructureStore, None] = None) -> pd.DataFrame:
+    '''
+    Writes many jobs, given as (structure, job_type, directory) tuples, using a process pool
+    Returns a manifest dataframe with one row per job, jobs that fail are marked as failed instead of stopping the batch
+    With a StructureStore, jobs that repeat an earlier structure are marked as duplicates and not written
+    '''
+    import pandas as pd
+
+    write = partial(_write_job, readme=readme, potcar_store=potcar_store, store=store)
+    if workers > 1 and len(jobs) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(jobs) // (4 * workers))
+            rows = list(executor.map(write, jobs, chunksize=chunksize))
+    else:
+        rows = [write(job) for job in jobs]
+
+    manifest = pd.DataFrame(rows, columns=["directory", "job_type", "formula", "num_sites", "files", "status", "duplicate_of", "error"])
+
+    return manifest
 
 
 def create_job_array(structure_list: list[Structure]) -> pd.DataFrame:
     '''
     Creates a pandas dataframe comparing the input parameters of a list of structures
     '''
+    import pandas as pd
 
     input_list = [vaspInput(structure, job_types["bulk_relaxation_med_prec"]) for structure in structure_list]
+
     df = pd.concat([input.as_dataframe() for input in input_list], ignore_index=True)
 
     return df
@@ -616,34 +1427,22 @@ def get_symmetry_info(structure: Structure) -> str:
     '''
     A function that determines the symmetry label of a structure
     '''
-    
-    space_group, intl_number = structure.get_space_group_info()
-
-    # 1-2 are triclinic, 3-15 are monoclinic, 16-74 are orthorhombic, 75-142 are tetragonal, 143-167 are trigonal, 168-194 are hexagonal, 195-230 are cubic
-    if intl_number <= 2:
-        symmetry = "triclinic"
-    elif intl_number <= 15:
-        symmetry = "monoclinic"
-    elif intl_number <= 74:
-        symmetry = "orthorhombic"
-    elif intl_number <= 142:
-        symmetry = "tetragonal"
-    elif intl_number <= 167:
-        symmetry = "trigonal"
-    elif intl_number <= 194:
-        symmetry = "hexagonal"
-    elif intl_number <= 230:
-        symmetry = "cubic"
-    else:
-        symmetry = "unknown"
-
-    return symmetry
+    return symmetry_info(structure).crystal_system
     
 class JobMatrix:
     '''
     Stores multiple vaspInput objects and provides methods for comparing them
+    The estimated memory, relative core-hours and recommended KPAR/NCORE of every job on cores (see cost.py) are added to the dataframe, cores=None skips them
     '''
     
-    def __init__(self, input_list: list[vaspInput]):
+    def __init__(self, input_list: list[vaspInput], cores: Union[int, None] = 128):
+        import pandas as pd
+
+        from cost import cost_dataframe
+
         self.input_list = input_list
+
         self.df = pd.concat([input.as_dataframe() for input in input_list], ignore_index=True)
+        if cores is not None:
+            costs = cost_dataframe(input_list, cores=cores)
+            self.df = pd.concat([self.df, costs[["nelect", "nbands", "n_plane_waves", "n_irreducible", "memory_gb", "relative_core_hours", "kpar", "ncore"]]], axis=1)
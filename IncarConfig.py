@@ -1,34 +1,243 @@
 import json
+import os
+import re
 from dataclasses import dataclass
+from functools import lru_cache
+from typing import Union
 
+resource_dir: str = os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources")
+incar_tags_file: str = os.path.join(resource_dir, "INCAR_TAGS.txt")
 
-def get_job_templates(json_file: str = "resources/jobTemplates.json") -> dict:
+# values that are filled in later, e.g. "{bands}" in bulk_relaxation.sh or "set_bands_manually" in the spin_orbit job
+placeholder_pattern = re.compile(r"^\{\w+\}$|^set_\w+_manually$")
+
+true_values: frozenset = frozenset({".TRUE.", "TRUE", "T", ".T."})
+false_values: frozenset = frozenset({".FALSE.", "FALSE", "F", ".F."})
+
+
+@dataclass(frozen=True)
+class TagSpec:
+    '''
+    Type and allowed values of an INCAR tag
+    kind is one of "bool", "int", "float", "str" or "list" (e.g. MAGMOM), choices are compared in upper case
+    '''
+    kind: str
+    minimum: Union[float, None] = None
+    maximum: Union[float, None] = None
+    choices: Union[frozenset, None] = None
+
+    def check(self, value) -> Union[str, None]:
+        '''
+        Returns a description of the problem with value, or None if it is valid
+        '''
+        if isinstance(value, str):
+            text = value.strip()
+            if placeholder_pattern.match(text):
+                return None
+        else:
+            text = str(value)
+
+        if self.kind == "bool":
+            if isinstance(value, bool) or text.upper() in true_values | false_values:
+                return None
+            return f"{value!r} is not a logical"
+
+        if self.kind in ("int", "float"):
+            try:
+                number = float(text.upper().replace("D", "E")) if isinstance(value, str) else float(value)
+            except (TypeError, ValueError):
+                return f"{value!r} is not a number"
+            if isinstance(value, bool) or (self.kind == "int" and not number.is_integer()):
+                return f"{value!r} is not an integer"
+            if self.minimum is not None and number < self.minimum:
+                return f"{value!r} is below {self.minimum:g}"
+            if self.maximum is not None and number > self.maximum:
+                return f"{value!r} is above {self.maximum:g}"
+            if self.choices is not None and int(number) not in self.choices:
+                return f"{value!r} is not one of {sorted(self.choices)}"
+            return None
+
+        if self.choices is not None and text.upper() not in self.choices:
+            return f"{value!r} is not one of {sorted(self.choices)}"
+
+        return None
+
+
+def _choices(*values) -> frozenset:
+    return frozenset(value.upper() if isinstance(value, str) else value for value in values)
+
+
+logical = TagSpec("bool")
+
+# metadata for the tags used by the job templates and other common tags, tags without metadata are only checked by name
+tag_specs: dict[str, TagSpec] = {
+    "SYSTEM": TagSpec("str"),
+    "PREC": TagSpec("str", choices=_choices("Low", "Medium", "High", "Normal", "Single", "SingleN", "Accurate")),
+    "ALGO": TagSpec("str", choices=_choices("Normal", "N", "VeryFast", "V", "Fast", "F", "Conjugate", "C", "All", "A", "Damped", "D", "Subrot", "Eigenval", "E",
+                                            "Exact", "None", "Nothing", "CHI", "G0W0", "GW0", "GW", "scGW0", "scGW", "BSE", "TDHF", "Jdft")),
+    "LREAL": TagSpec("str", choices=_choices("Auto", "A", "On", "O") | true_values | false_values),
+    "GGA": TagSpec("str"),
+    "METAGGA": TagSpec("str"),
+    "MAGMOM": TagSpec("list"),
+    "ENCUT": TagSpec("float", minimum=0),
+    "ENAUG": TagSpec("float", minimum=0),
+    "EDIFF": TagSpec("float", minimum=0),
+    "EDIFFG": TagSpec("float"),
+    "SIGMA": TagSpec("float", minimum=0),
+    "POTIM": TagSpec("float", minimum=0),
+    "NELECT": TagSpec("float", minimum=0),
+    "NUPDOWN": TagSpec("float"),
+    "KSPACING": TagSpec("float", minimum=0),
+    "EMIN": TagSpec("float"),
+    "EMAX": TagSpec("float"),
+    "CMBJ": TagSpec("float"),
+    "AEXX": TagSpec("float", minimum=0, maximum=1),
+    "HFSCREEN": TagSpec("float", minimum=0),
+    "ISTART": TagSpec("int", minimum=0, maximum=3),
+    "ICHARG": TagSpec("int", choices=frozenset({0, 1, 2, 4, 5, 10, 11, 12})),
+    "ISPIN": TagSpec("int", choices=frozenset({1, 2})),
+    "NELM": TagSpec("int", minimum=1),
+    "NELMIN": TagSpec("int", minimum=1),
+    "NELMDL": TagSpec("int"),
+    "NSW": TagSpec("int", minimum=0),
+    "IBRION": TagSpec("int", choices=frozenset({-1, 0, 1, 2, 3, 5, 6, 7, 8, 11, 12, 40, 44})),
+    "ISIF": TagSpec("int", minimum=0, maximum=8),
+    "ISMEAR": TagSpec("int", minimum=-5),
+    "ISYM": TagSpec("int", minimum=-1, maximum=3),
+    "IALGO": TagSpec("int"),
+    "VOSKOWN": TagSpec("int", choices=frozenset({0, 1})),
+    "LMAXMIX": TagSpec("int", minimum=0),
+    "LORBIT": TagSpec("int", choices=frozenset({0, 1, 2, 5, 10, 11, 12, 13, 14})),
+    "NBANDS": TagSpec("int", minimum=1),
+    "NEDOS": TagSpec("int", minimum=1),
+    "NCORE": TagSpec("int", minimum=1),
+    "NPAR": TagSpec("int", minimum=1),
+    "KPAR": TagSpec("int", minimum=1),
+    "NSIM": TagSpec("int", minimum=1),
+    "NWRITE": TagSpec("int", minimum=0, maximum=4),
+    "IDIPOL": TagSpec("int", minimum=1, maximum=4),
+    "IVDW": TagSpec("int", minimum=0),
+    "ADDGRID": logical,
+    "GGA_COMPAT": logical,
+    "KGAMMA": logical,
+    "LASPH": logical,
+    "LCHARG": logical,
+    "LDAU": logical,
+    "LDIPOL": logical,
+    "LELF": logical,
+    "LHFCALC": logical,
+    "LNONCOLLINEAR": logical,
+    "LOPTICS": logical,
+    "LPARD": logical,
+    "LSORBIT": logical,
+    "LVHAR": logical,
+    "LVTOT": logical,
+    "LWAVE": logical,
+}
+
+
+@lru_cache(maxsize=None)
+def load_incar_tags(tags_file: str = incar_tags_file) -> frozenset:
+    '''
+    Reads the valid INCAR tags once per process
+    '''
+    with open(tags_file, "r") as f:
+        return frozenset(line.strip().upper() for line in f if line.strip())
+
+
+@lru_cache(maxsize=4096)
+def _validate_items(items: tuple, tags_file: str) -> tuple[str, ...]:
+    valid_tags = load_incar_tags(tags_file)
+    problems = []
+    for key, value in items:
+        tag = key.upper()
+        if tag not in valid_tags:
+            problems.append(f"Invalid INCAR tag: {key}")
+            continue
+        spec = tag_specs.get(tag)
+        problem = spec.check(value) if spec is not None else None
+        if problem is not None:
+            problems.append(f"Invalid value for {key}: {problem}")
+
+    return tuple(problems)
+
+
+def validate_incar_dict(parameters: dict, raise_error: bool = True, tags_file: str = incar_tags_file) -> list[str]:
+    '''
+    Checks every tag of an INCAR parameter dictionary against the tag list and the tag metadata in a single pass
+    Returns all problems found, or raises a ValueError listing them if raise_error is set
+    Results are memoized, so validating the same template again costs a dictionary lookup
+    '''
+    try:
+        problems = _validate_items(tuple(parameters.items()), tags_file)
+    except TypeError:
+        # unhashable values (e.g. a MAGMOM list) skip the memoization
+        problems = _validate_items.__wrapped__(tuple(parameters.items()), tags_file)
+
+    if problems and raise_error:
+        raise ValueError("ERROR: " + "; ".join(problems))
+
+    return list(problems)
+
+
+def get_job_templates(json_file: str = os.path.join(resource_dir, "jobTemplates.json")) -> dict:
     '''
     Loads incar parameter dictionaries from json file
+    Templates may inherit from others with "extends" (a name or a list of names applied in order), names starting with _ are only used as bases
     '''
     with open(json_file, "r") as f:
         job_templates = json.load(f)
 
     return job_templates
 
-def get_incar_dict(job_type: str, job_templates: dict, json_file: str = "resources/INCAR_TAGS.txt") -> dict:
+
+def resolve_template(job_type: str, job_templates: dict, _seen: tuple = ()) -> dict:
     '''
-    Returns incar parameter dictionary for given job type
+    Returns the parameters of a template merged with those of its bases, tags are upper case so overrides do not depend on case
     '''
-    #check if incar tags are valid using "AutoVASP/resources/INCAR_TAGS.txt"
-    incar_tags = [ line.strip() for line in open(json_file, "r") ]
-    for key in job_templates[job_type]:
-        if key not in incar_tags:
-            raise ValueError(f"ERROR: Invalid INCAR tag: {key}")
+    if job_type in _seen:
+        raise ValueError(f"ERROR: Circular template inheritance: {' -> '.join(_seen + (job_type,))}")
+    if job_type not in job_templates:
+        raise KeyError(f"Unknown job template: {job_type}")
+
+    template = job_templates[job_type]
+    bases = template.get("extends", [])
+    bases = [bases] if isinstance(bases, str) else bases
 
-    return job_templates[job_type]
+    parameters: dict = {}
+    for base in bases:
+        parameters.update(resolve_template(base, job_templates, _seen + (job_type,)))
+    parameters.update((key.upper(), value) for key, value in template.items() if key != "extends")
 
+    return parameters
 
 
+def resolve_job_templates(job_templates: dict) -> dict[str, dict]:
+    '''
+    Resolves and validates every template that is not a base (name starting with _)
+    '''
+    resolved = {}
+    for job_type in job_templates:
+        if not job_type.startswith("_"):
+            resolved[job_type] = resolve_template(job_type, job_templates)
+            validate_incar_dict(resolved[job_type])
 
+    return resolved
 
 
+def load_job_types(json_file: str = os.path.join(resource_dir, "jobTemplates.json")) -> dict[str, dict]:
+    '''
+    The resolved job templates, this is the source of AutoVASP.job_types
+    '''
+    return resolve_job_templates(get_job_templates(json_file))
 
 
-    
+def get_incar_dict(job_type: str, job_templates: dict, json_file: str = incar_tags_file) -> dict:
+    '''
+    Returns incar parameter dictionary for given job type
+    '''
+    incar_dict = resolve_template(job_type, job_templates)
+    #check if incar tags and values are valid using "AutoVASP/resources/INCAR_TAGS.txt"
+    validate_incar_dict(incar_dict, tags_file=json_file)
 
+    return incar_dict
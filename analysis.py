@@ -1,7 +1,5 @@
 import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 
 # There will be four files in the data folder
 # 1. Data from slabs without SOC resources/slabs.csv
@@ -9,37 +7,53 @@ import plotly.graph_objects as go
 # 3. Data from slabs with adsorbates resources/slabs_adsorbates.csv
 # 4. Data from adsorbates resources/adsorbates.csv
 
-# Read the data from the files
-slabs = pd.read_csv('resources/slabs.csv')
-slabs_soc = pd.read_csv('resources/slabs_soc.csv')
-slabs_adsorbates = pd.read_csv('resources/slabs_adsorbates.csv')
-adsorbates = pd.read_csv('resources/adsorbates.csv')
+# substrings of "Directory" that identify each system, checked in this order
+system_markers: list[tuple[str, str, str]] = [("Bi", "Se", "Bi2Se3"), ("Bi", "Te", "Bi2Te3"), ("Sb", "Se", "Sb2Se3"), ("Sb", "Te", "Sb2Te3")]
+
+
+def load_data(resource_dir: str = "resources") -> dict[str, pd.DataFrame]:
+    '''
+    Reads the four csv files from the resources folder
+    '''
+    data = {"slabs": pd.read_csv(f"{resource_dir}/slabs.csv"),
+            "slabs_soc": pd.read_csv(f"{resource_dir}/slabs_soc.csv"),
+            "slabs_adsorbates": pd.read_csv(f"{resource_dir}/slabs_adsorbates.csv"),
+            "adsorbates": pd.read_csv(f"{resource_dir}/adsorbates.csv")}
+
+    return data
 
-#create a dictionary of adsorbates and their corresponding Energy
-adsorbates_dict = dict(zip(adsorbates['Adsorbate'], adsorbates['Energy']))
 
 def make_adsorbate_dict(adsorbates_df: pd.DataFrame) -> dict:
     return dict(zip(adsorbates_df['Adsorbate'], adsorbates_df['Energy']))
 
+
 def find_system(slabs_adsorbed_df: pd.DataFrame) -> str:
     # if the substrings Bi and Se are in "Directory", then the System is Bi2Se3
    #If the substrings Bi and Te are in "Directory", then the System is Bi2Te3
    # If the substrings Sb and Se are in "Directory", then the System is Sb2Se3
    # If the substrings Sb and Te are in "Directory", then the System is Sb2Te3
-    if 'Bi' in slabs_adsorbed_df['Directory'] and 'Se' in slabs_adsorbed_df['Directory']:
-        return 'Bi2Se3'
-    elif 'Bi' in slabs_adsorbed_df['Directory'] and 'Te' in slabs_adsorbed_df['Directory']:
-        return 'Bi2Te3'
-    elif 'Sb' in slabs_adsorbed_df['Directory'] and 'Se' in slabs_adsorbed_df['Directory']:
-        return 'Sb2Se3'
-    elif 'Sb' in slabs_adsorbed_df['Directory'] and 'Te' in slabs_adsorbed_df['Directory']:
-        return 'Sb2Te3'
-    else:
+    for first, second, system in system_markers:
+        if first in slabs_adsorbed_df['Directory'] and second in slabs_adsorbed_df['Directory']:
+            return system
+
+    raise ValueError('System not found')
+
+
+def find_systems(directories: pd.Series) -> pd.Series:
+    '''
+    Vectorized find_system for a whole column of directory names
+    '''
+    conditions = [directories.str.contains(first, regex=False) & directories.str.contains(second, regex=False) for first, second, _ in system_markers]
+    systems = np.select(conditions, [system for _, _, system in system_markers], default="")
+    if (systems == "").any():
         raise ValueError('System not found')
 
+    return pd.Series(systems, index=directories.index, name='System')
+
+
 def format_adsorbates_dataframe(slabs_adsorbed_df: pd.DataFrame) -> pd.DataFrame:
     #update the dataframe with a new column called "System"
-    slabs_adsorbed_df['System'] = slabs_adsorbed_df.apply(find_system, axis=1)
+    slabs_adsorbed_df['System'] = find_systems(slabs_adsorbed_df['Directory'])
 
     return slabs_adsorbed_df
 
@@ -59,33 +73,50 @@ def E_system(slab_df: pd.DataFrame, system: str, adsorbate: str) -> float:
     return slab_df[ ( slab_df['System'] == system ) & ( slab_df['Adsorbate'] == adsorbate)]['Energy'].values[0]
 
 
-format_adsorbates_dataframe(slabs_adsorbates) 
+def _lookup(df: pd.DataFrame, table: pd.DataFrame, keys: list[str], name: str) -> pd.Series:
+    '''
+    Left joins table onto the key columns of df and returns the joined "Energy" column, aligned with df
+    '''
+    joined = df[keys].merge(table[keys + ['Energy']], on=keys, how='left', indicator=True, validate='many_to_one')
+    missing = (joined['_merge'] != 'both').values
+    if missing.any():
+        raise KeyError(f"No {name} energy for {df.loc[missing, keys].drop_duplicates().values.tolist()}")
+
+    return pd.Series(joined['Energy'].values, index=df.index)
 
-def calc_E_adsorption(slabs_df: pd.DataFrame, adsorbates_df: pd.DataFrame, adsorbed_slabs_df: pd.DataFrame) -> pd.DataFrame:
-    # Create a dictionary of adsorbates and their corresponding energy
-    adsorbates_dict = make_adsorbate_dict(adsorbates_df)
 
+def calc_E_adsorption(slabs_df: pd.DataFrame, adsorbates_df: pd.DataFrame, adsorbed_slabs_df: pd.DataFrame) -> pd.DataFrame:
+    '''
+    Adds an "Adsorption Energy" column to the adsorbed slabs using joins instead of row-wise lookups
+    As before, the first matching row is used when a system or system/adsorbate pair appears more than once
+    '''
     # Format the adsorbed slabs dataframe
     adsorbed_slabs_df = format_adsorbates_dataframe(adsorbed_slabs_df)
-    
+
     # Create a new dataframe with the adsorption energy
     adsorption_energy_df = adsorbed_slabs_df.copy()
-    E_sys = adsorption_energy_df.apply(lambda x: E_system(adsorbed_slabs_df, x['System'], x['Adsorbate']), axis=1)
-    E_slb = adsorption_energy_df.apply(lambda x: E_slab(slabs_df, x['System']), axis=1)
-    E_ads = adsorption_energy_df.apply(lambda x: E_adsorbate(x['Adsorbate'], adsorbates_dict), axis=1)
+    systems = adsorbed_slabs_df.drop_duplicates(['System', 'Adsorbate'], keep='first')
+    slabs = slabs_df.drop_duplicates('System', keep='first')
+    adsorbates = adsorbates_df.drop_duplicates('Adsorbate', keep='last')
+
+    E_sys = _lookup(adsorption_energy_df, systems, ['System', 'Adsorbate'], 'adsorbed system')
+    E_slb = _lookup(adsorption_energy_df, slabs, ['System'], 'slab')
+    E_ads = _lookup(adsorption_energy_df, adsorbates, ['Adsorbate'], 'adsorbate')
     adsorption_energy_df['Adsorption Energy'] = ( E_sys - E_slb - E_ads ) * -1
 
     return adsorption_energy_df
 
-adsorption_energy_df = calc_E_adsorption(slabs, adsorbates, slabs_adsorbates)
-
-#plot the adsorption energy
-fig = px.scatter(adsorption_energy_df, x='Adsorbate', y='Adsorption Energy', color='System', hover_data=['Directory'])
-fig.show()
-
-
 
+def main() -> None:
+    import plotly.express as px
 
+    data = load_data()
+    adsorption_energy_df = calc_E_adsorption(data["slabs"], data["adsorbates"], data["slabs_adsorbates"])
 
+    #plot the adsorption energy
+    fig = px.scatter(adsorption_energy_df, x='Adsorbate', y='Adsorption Energy', color='System', hover_data=['Directory'])
+    fig.show()
 
 
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import fnmatch
+import io
+import json
+import os
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from functools import cached_property
+from typing import Union
+
+import numpy as np
+import pandas as pd
+from pymatgen.core.structure import Structure
+
+# raw files kept next to the parsed results unless other patterns are given, ["*"] keeps every file
+default_raw_files: list[str] = ["INCAR", "KPOINTS", "POSCAR", "CONTCAR"]
+
+
+def _npy_bytes(array: np.ndarray) -> bytes:
+    buffer = io.BytesIO()
+    np.save(buffer, array, allow_pickle=False)
+
+    return buffer.getvalue()
+
+
+def run_members(directory: str, raw_files: list[str] = default_raw_files, parse: bool = True) -> tuple[dict, dict[str, bytes]]:
+    '''
+    Collects the archive members of one run directory
+    Returns the run metadata and a dictionary of member name (relative to the run) to contents
+    Parsed quantities are the final structure, the ionic steps from OUTCAR and, from vasprun.xml, the eigenvalues, k-points and total DOS
+    If parsing fails (e.g. the truncated vasprun.xml of a running job), the error is recorded in the metadata and only the raw files are kept
+    '''
+    meta: dict = {"directory": os.path.abspath(directory), "quantities": [], "files": [], "error": None}
+    try:
+        members = _parsed_members(directory, meta) if parse else {}
+    except Exception as error:
+        meta = {"directory": meta["directory"], "quantities": [], "files": [], "error": f"{type(error).__name__}: {error}"}
+        members = {}
+
+    meta["quantities"] = sorted(os.path.splitext(member)[0] for member in members)
+
+    for filename in sorted(os.listdir(directory)):
+        path = os.path.join(directory, filename)
+        if os.path.isfile(path) and any(fnmatch.fnmatch(filename, pattern) for pattern in raw_files):
+            with open(path, "rb") as f:
+                members["files/" + filename] = f.read()
+            meta["files"].append(filename)
+
+    return meta, members
+
+
+def _parsed_members(directory: str, meta: dict) -> dict[str, bytes]:
+    '''
+    Parses the results of a run into archive members, adding the scalar results to meta
+    '''
+    from AutoVASP import vaspOutput
+
+    members: dict[str, bytes] = {}
+    output = vaspOutput(directory)
+
+    if os.path.exists(os.path.join(directory, "vasprun.xml")):
+        vasprun = output.vasprun
+        structure = vasprun.final_structure
+        meta.update({"formula": structure.composition.reduced_formula, "num_sites": structure.num_sites, "energy": float(vasprun.final_energy),
+                     "energy_per_atom": float(vasprun.final_energy) / structure.num_sites, "efermi": vasprun.efermi,
+                     "n_ionic_steps": len(vasprun.ionic_steps), "n_kpoints": len(vasprun.actual_kpoints)})
+        members["structure.json"] = json.dumps(structure.as_dict()).encode()
+        members["kpoints.npy"] = _npy_bytes(np.array(vasprun.actual_kpoints, dtype=float))
+        if vasprun.eigenvalues:
+            spins = sorted(vasprun.eigenvalues, key=lambda spin: -spin.value)
+            members["eigenvalues.npy"] = _npy_bytes(np.stack([vasprun.eigenvalues[spin] for spin in spins]))
+        if vasprun.complete_dos is not None and len(vasprun.complete_dos.energies):
+            dos = vasprun.complete_dos
+            spins = sorted(dos.densities, key=lambda spin: -spin.value)
+            members["dos.npy"] = _npy_bytes(np.vstack([dos.energies] + [dos.densities[spin] for spin in spins]))
+
+    if os.path.exists(os.path.join(directory, "OUTCAR")):
+        members["ionic_steps.npy"] = _npy_bytes(output.ionic_steps)
+
+    return members
+
+
+def _run_members(job: tuple) -> tuple[dict, dict[str, bytes]]:
+    return run_members(*job)
+
+
+class ArchiveWriter:
+    '''
+    Writes run directories into a zip archive, every member is compressed on its own so it can be read back without unpacking the rest
+    Each run is stored under runs/<name>/ with meta.json (the per-run index), parsed quantities as .npy/.json and raw files under files/
+    mode="a" adds runs to an existing archive
+    '''
+
+    def __init__(self, filename: str, mode: str = "w", compresslevel: int = 6) -> None:
+        if mode not in ("w", "a"):
+            raise ValueError("mode must be either 'w' or 'a'")
+        self.filename = filename
+        self._zip = zipfile.ZipFile(filename, mode, compression=zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self._names = set(_run_names(self._zip))
+
+    def __enter__(self) -> ArchiveWriter:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._zip.close()
+
+    def write_run(self, name: str, meta: dict, members: dict[str, bytes]) -> None:
+        if name in self._names:
+            raise ValueError(f"{name} is already in {self.filename}")
+        for member, contents in members.items():
+            self._zip.writestr(f"runs/{name}/{member}", contents)
+        self._zip.writestr(f"runs/{name}/meta.json", json.dumps(meta))
+        self._names.add(name)
+
+    def add_run(self, directory: str, name: Union[str, None] = None, raw_files: list[str] = default_raw_files, parse: bool = True) -> str:
+        '''
+        Adds one run directory, returns its name in the archive
+        '''
+        name = name if name is not None else os.path.basename(os.path.abspath(directory))
+        self.write_run(name, *run_members(directory, raw_files, parse))
+
+        return name
+
+
+def _write_run(writer: ArchiveWriter, name: str, meta: dict, members: dict[str, bytes]) -> None:
+    if meta["error"] is not None:
+        print(f"WARNING: could not parse {meta['directory']} ({meta['error']}), only its raw files are archived")
+    writer.write_run(name, meta, members)
+
+
+def _run_names(archive: zipfile.ZipFile) -> list[str]:
+    return [member[len("runs/"):-len("/meta.json")] for member in archive.namelist() if member.startswith("runs/") and member.endswith("/meta.json")]
+
+
+def write_archive(directories: list[str], filename: str, names: Union[list[str], None] = None, raw_files: list[str] = default_raw_files, parse: bool = True,
+                  workers: int = 1, mode: str = "w") -> list[str]:
+    '''
+    Archives several run directories, parsing them in parallel with workers > 1
+    By default runs are named by their path relative to the parent of the directories' common path
+    Runs that cannot be parsed are archived with their raw files and the error in their metadata (the error column of RunArchive.index)
+    Returns the names of the archived runs
+    '''
+    if names is None:
+        parent = os.path.dirname(os.path.commonpath([os.path.abspath(directory) for directory in directories])) if directories else ""
+        names = [os.path.relpath(os.path.abspath(directory), parent) for directory in directories]
+
+    jobs = [(directory, raw_files, parse) for directory in directories]
+    with ArchiveWriter(filename, mode) as writer:
+        if workers > 1 and len(jobs) > 1:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                for name, (meta, members) in zip(names, executor.map(_run_members, jobs)):
+                    _write_run(writer, name, meta, members)
+        else:
+            for name, job in zip(names, jobs):
+                _write_run(writer, name, *run_members(*job))
+
+    return list(names)
+
+
+class RunArchive:
+    '''
+    Random access reader for archives made by ArchiveWriter, only the members that are asked for are decompressed
+    '''
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self._zip = zipfile.ZipFile(filename, "r")
+
+    def __enter__(self) -> RunArchive:
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
+
+    def close(self) -> None:
+        self._zip.close()
+
+    @property
+    def runs(self) -> list[str]:
+        return _run_names(self._zip)
+
+    def _read(self, name: str, member: str) -> bytes:
+        try:
+            return self._zip.read(f"runs/{name}/{member}")
+        except KeyError:
+            raise KeyError(f"{member} of run {name} is not in {self.filename}") from None
+
+    def meta(self, name: str) -> dict:
+        return json.loads(self._read(name, "meta.json"))
+
+    @cached_property
+    def index(self) -> pd.DataFrame:
+        '''
+        One row per run with the scalar results and the stored quantities and files
+        '''
+        rows = []
+        for name in self.runs:
+            meta = self.meta(name)
+            meta["quantities"] = ",".join(meta["quantities"])
+            meta["files"] = ",".join(meta["files"])
+            rows.append({"name": name, **meta})
+
+        return pd.DataFrame(rows)
+
+    def get(self, name: str, quantity: str) -> np.ndarray:
+        '''
+        Returns a stored array: eigenvalues (spin, k-point, band, [energy, occupation]), kpoints, dos (energies, then one row per spin) or ionic_steps
+        '''
+        return np.load(io.BytesIO(self._read(name, quantity + ".npy")), allow_pickle=False)
+
+    def structure(self, name: str) -> Structure:
+        return Structure.from_dict(json.loads(self._read(name, "structure.json")))
+
+    def read_file(self, name: str, filename: str) -> str:
+        return self._read(name, "files/" + filename).decode()
+
+    def extract(self, name: str, destination: str, files: Union[list[str], None] = None) -> list[str]:
+        '''
+        Writes the raw files of a run (or only the given ones) to destination, returns their paths
+        '''
+        os.makedirs(destination, exist_ok=True)
+        paths = []
+        for filename in files if files is not None else self.meta(name)["files"]:
+            path = os.path.join(destination, filename)
+            with open(path, "wb") as f:
+                f.write(self._read(name, "files/" + filename))
+            paths.append(path)
+
+        return paths
@@ -0,0 +1,345 @@
+'''
+Command line interface for batch operations on many files in one interpreter
+
+    python cli.py freeze POSCAR_* --min-z 5
+    python cli.py extend "slabs/*.vasp" -x 3 -y 3
+    find . -name CONTCAR | python cli.py write-inputs - --job-type dos --save-dir jobs
+    python cli.py harvest runs --output results.csv --cache
+    python cli.py status runs --status converged --paths
+    python cli.py archive runs --output runs.zip --workers 4
+
+Paths can be globs, "-" reads paths from stdin and --manifest reads paths from a file (one per line)
+"python cli.py serve --socket PATH" starts a resident worker, commands given with --socket PATH are then run by the worker
+so each call from a batch shell does not pay for interpreter startup and imports again
+'''
+from __future__ import annotations
+
+import argparse
+import glob
+import io
+import json
+import os
+import socket
+import socketserver
+import sys
+from contextlib import redirect_stderr, redirect_stdout
+from typing import Callable, TextIO, Union
+
+import AutoVASP
+
+# replies from the worker end with a newline, requests are a single JSON line
+buffer_size = 1 << 16
+
+
+def expand_paths(patterns: list[str], manifest: Union[str, None] = None, stdin: TextIO = sys.stdin) -> list[str]:
+    '''
+    Expands globs, reads paths from stdin for "-" and from a manifest file, blank lines and lines starting with # are ignored
+    Patterns without a match are kept so they are reported as missing files
+    '''
+    lines = []
+    if manifest is not None:
+        with open(manifest, "r") as f:
+            lines.extend(f.read().splitlines())
+    for pattern in patterns:
+        if pattern == "-":
+            lines.extend(stdin.read().splitlines())
+        else:
+            lines.append(pattern)
+
+    paths = []
+    for line in lines:
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        paths.extend(sorted(glob.glob(line)) or [line])
+
+    return list(dict.fromkeys(paths))
+
+
+def _for_each(paths: list[str], operation: Callable[[str], str]) -> int:
+    '''
+    Applies operation to every path, errors are reported per file instead of stopping the batch
+    Returns the number of failures
+    '''
+    failures = 0
+    for path in paths:
+        try:
+            print(operation(path))
+        except Exception as error:
+            print(f"ERROR: {path} ({type(error).__name__}: {error})")
+            failures += 1
+
+    return failures
+
+
+def freeze_file(path: str, min_z: float, suffix: str = "_frozen") -> str:
+    '''
+    Freezes the atoms of a POSCAR/CONTCAR below min_z and writes the result next to the original
+    '''
+    structure = AutoVASP.freeze_structure(AutoVASP.structure_from_file(path), min_z)
+    structure.to(filename=path + suffix, fmt="poscar")
+
+    return path + suffix
+
+
+def extend_file(path: str, x_repeat: int = 3, y_repeat: int = 3, z_repeat: int = 1, suffix: str = "_extended") -> str:
+    '''
+    Writes a supercell of a POSCAR/CONTCAR next to the original
+    '''
+    structure = AutoVASP.extend_structure(AutoVASP.structure_from_file(path), x_repeat, y_repeat, z_repeat)
+    structure.to(filename=path + suffix, fmt="poscar")
+
+    return path + suffix
+
+
+def write_inputs(paths: list[str], job_type: str, save_dir: str = "./", workers: int = 1, readme: bool = False,
+                 potcar_store: Union[str, None] = None, store: Union[str, None] = None):
+    '''
+    Writes one job directory per structure file, directories are named with make_directory_name and numbered if a name repeats
+    Returns the write_job_batch manifest with an extra "source" column
+    '''
+    from store import StructureStore
+
+    jobs = []
+    sources = []
+    failures = []
+    names: dict[str, int] = {}
+    for path in paths:
+        try:
+            structure = AutoVASP.structure_from_file(path)
+        except Exception as error:
+            failures.append((path, f"{type(error).__name__}: {error}"))
+            continue
+        name = AutoVASP.make_directory_name(structure, job_type)
+        names[name] = names.get(name, 0) + 1
+        if names[name] > 1:
+            name = f"{name}_{names[name]}"
+        jobs.append((structure, job_type, os.path.join(save_dir, name)))
+        sources.append(path)
+
+    structure_store = StructureStore(store) if store is not None else None
+    manifest = AutoVASP.write_job_batch(jobs, workers=workers, readme=readme, potcar_store=potcar_store, store=structure_store)
+    manifest.insert(0, "source", sources)
+    for path, error in failures:
+        manifest.loc[len(manifest), ["source", "job_type", "status", "error"]] = [path, job_type, "failed", error]
+
+    return manifest
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="autovasp", description="Batch operations on VASP structures, inputs and runs")
+    parser.add_argument("--socket", help="send the command to the worker listening on this Unix socket (runs locally if none is listening)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_paths(subparser: argparse.ArgumentParser) -> None:
+        subparser.add_argument("paths", nargs="*", help="files or globs, - reads paths from stdin")
+        subparser.add_argument("--manifest", help="file with one path per line")
+
+    freeze = subparsers.add_parser("freeze", help="freeze the atoms below min_z with selective dynamics")
+    add_paths(freeze)
+    freeze.add_argument("--min-z", type=float, required=True)
+    freeze.add_argument("--suffix", default="_frozen")
+
+    extend = subparsers.add_parser("extend", help="write supercells")
+    add_paths(extend)
+    extend.add_argument("-x", type=int, default=3)
+    extend.add_argument("-y", type=int, default=3)
+    extend.add_argument("-z", type=int, default=1)
+    extend.add_argument("--suffix", default="_extended")
+
+    write = subparsers.add_parser("write-inputs", help="write a job directory for each structure")
+    add_paths(write)
+    write.add_argument("--job-type", required=True, choices=sorted(AutoVASP.job_types))
+    write.add_argument("--save-dir", default="./")
+    write.add_argument("--workers", type=int, default=1)
+    write.add_argument("--readme", action="store_true")
+    write.add_argument("--potcar-store", help="directory of shared POTCAR files to hard link from")
+    write.add_argument("--store", help="StructureStore file used to skip duplicate structures")
+    write.add_argument("--output", help="write the manifest to this csv file instead of printing it")
+
+    harvest = subparsers.add_parser("harvest", help="collect the results of every run below a directory")
+    harvest.add_argument("root")
+    harvest.add_argument("--workers", type=int, default=1)
+    harvest.add_argument("--cache", action="store_true", help="only parse runs that changed since the last harvest")
+    harvest.add_argument("--output", help="write the results to this csv file instead of printing them")
+
+    archive = subparsers.add_parser("archive", help="store the parsed results and raw files of every run below a directory in a zip archive")
+    archive.add_argument("root")
+    archive.add_argument("--output", required=True)
+    archive.add_argument("--raw-files", nargs="*", help="patterns of the raw files to keep (default INCAR KPOINTS POSCAR CONTCAR), * keeps every file")
+    archive.add_argument("--no-parse", action="store_true", help="only store the raw files")
+    archive.add_argument("--append", action="store_true", help="add the runs to an existing archive")
+    archive.add_argument("--workers", type=int, default=1)
+
+    status = subparsers.add_parser("status", help="report whether jobs are converged, running, failed or not started")
+    status.add_argument("directories", nargs="*", default=["./"], help="job directories, or directories to search for jobs")
+    status.add_argument("--workers", type=int, default=1)
+    status.add_argument("--stale-after", type=float, help="treat unfinished jobs whose OUTCAR is older than this many seconds as failed")
+    status.add_argument("--status", dest="only", choices=["converged", "running", "failed", "not started"], help="only report jobs with this status")
+    status.add_argument("--relaxation-only", action="store_true", help="only report relaxations (NSW > 0 and IBRION != -1), not DOS, band or other static runs")
+    status.add_argument("--paths", action="store_true", help="only print the job directories")
+    status.add_argument("--columns", help="only print these comma separated columns, without a header")
+    status.add_argument("--output", help="write the table to this csv file instead of printing it")
+
+    serve = subparsers.add_parser("serve", help="run a worker that executes commands sent over a Unix socket")
+    serve.add_argument("--socket", dest="serve_socket", required=True)
+
+    return parser
+
+
+def run(argv: list[str], stdin: TextIO = sys.stdin) -> int:
+    '''
+    Runs one command in this interpreter and returns its exit status
+    '''
+    args = build_parser().parse_args(argv)
+
+    if args.command == "serve":
+        serve(args.serve_socket)
+        return 0
+
+    if args.command == "harvest":
+        from harvest import harvest
+
+        df = harvest(args.root, workers=args.workers, cache=args.cache)
+        if args.output is not None:
+            df.to_csv(args.output, index=False)
+        else:
+            print(df.to_csv(index=False), end="")
+        return 1 if df.attrs["failures"] else 0
+
+    if args.command == "archive":
+        from archive import default_raw_files, write_archive
+        from harvest import find_run_directories
+
+        directories = find_run_directories(args.root)
+        names = [os.path.relpath(directory, args.root) if os.path.abspath(directory) != os.path.abspath(args.root) else os.path.basename(os.path.abspath(directory))
+                 for directory in directories]
+        raw_files = args.raw_files if args.raw_files is not None else default_raw_files
+        for name in write_archive(directories, args.output, names, raw_files, parse=not args.no_parse, workers=args.workers, mode="a" if args.append else "w"):
+            print(name)
+        return 0
+
+    if args.command == "status":
+        import pandas as pd
+
+        from outcar import find_job_directories, scan_jobs
+
+        # a directory with job files is a job, any other directory is searched for jobs
+        directories = []
+        for directory in args.directories:
+            if os.path.exists(os.path.join(directory, "INCAR")) or os.path.exists(os.path.join(directory, "OUTCAR")):
+                directories.append(directory)
+            else:
+                directories.extend(find_job_directories(directory))
+        df = scan_jobs(directories=directories, workers=args.workers, stale_after=args.stale_after)
+        if args.only is not None:
+            df = df[df["status"] == args.only]
+        if args.relaxation_only:
+            df = df[df["relaxation"].eq(True)]
+        if args.paths:
+            print("".join(os.path.normpath(directory) + "\n" for directory in df["directory"]), end="")
+        elif args.columns is not None:
+            print(df[args.columns.split(",")].to_csv(index=False, header=False), end="")
+        elif args.output is not None:
+            df.to_csv(args.output, index=False)
+        else:
+            with pd.option_context("display.max_rows", None, "display.width", None):
+                print(df.drop(columns="error") if df["error"].isna().all() else df)
+        return 0
+
+    paths = expand_paths(args.paths, args.manifest, stdin)
+
+    if args.command == "freeze":
+        return 1 if _for_each(paths, lambda path: freeze_file(path, args.min_z, args.suffix)) else 0
+
+    if args.command == "extend":
+        return 1 if _for_each(paths, lambda path: extend_file(path, args.x, args.y, args.z, args.suffix)) else 0
+
+    manifest = write_inputs(paths, args.job_type, args.save_dir, workers=args.workers, readme=args.readme, potcar_store=args.potcar_store, store=args.store)
+    if args.output is not None:
+        manifest.to_csv(args.output, index=False)
+    else:
+        print(manifest.to_csv(index=False), end="")
+
+    return 1 if (manifest["status"] == "failed").any() else 0
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    '''
+    Runs a request {"argv": [...], "cwd": ..., "stdin": ...} and replies {"status": ..., "stdout": ...}
+    '''
+
+    def handle(self) -> None:
+        request = json.loads(self.rfile.readline())
+        stdout = io.StringIO()
+        cwd = os.getcwd()
+        try:
+            os.chdir(request.get("cwd", cwd))
+            with redirect_stdout(stdout), redirect_stderr(stdout):
+                status = run(request["argv"], io.StringIO(request.get("stdin", "")))
+        except SystemExit as error:
+            # argparse exits on bad arguments
+            status = error.code if isinstance(error.code, int) else 2
+        except Exception as error:
+            print(f"ERROR: {type(error).__name__}: {error}", file=stdout)
+            status = 1
+        finally:
+            os.chdir(cwd)
+
+        self.wfile.write((json.dumps({"status": status, "stdout": stdout.getvalue()}) + "\n").encode())
+
+
+def serve(socket_path: str) -> None:
+    '''
+    Serves requests on a Unix socket until interrupted, requests are handled one at a time
+    '''
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    with socketserver.UnixStreamServer(socket_path, _RequestHandler) as server:
+        try:
+            server.serve_forever()
+        finally:
+            os.remove(socket_path)
+
+
+def send(socket_path: str, argv: list[str], stdin: TextIO = sys.stdin) -> tuple[int, str]:
+    '''
+    Sends a command to a worker and returns its exit status and output
+    Paths read from stdin ("-") are forwarded, relative paths are resolved in the working directory of the caller
+    '''
+    request = {"argv": argv, "cwd": os.getcwd(), "stdin": stdin.read() if "-" in argv else ""}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as client:
+        client.connect(socket_path)
+        client.sendall((json.dumps(request) + "\n").encode())
+        reply = b""
+        while not reply.endswith(b"\n"):
+            chunk = client.recv(buffer_size)
+            if not chunk:
+                break
+            reply += chunk
+
+    reply = json.loads(reply)
+
+    return reply["status"], reply["stdout"]
+
+
+def main(argv: Union[list[str], None] = None) -> int:
+    argv = sys.argv[1:] if argv is None else argv
+    args = build_parser().parse_args(argv)
+    # drop the options that come before the command
+    command_argv = argv[argv.index(args.command):]
+
+    if args.socket is not None and args.command != "serve":
+        try:
+            status, stdout = send(args.socket, command_argv)
+        except (ConnectionRefusedError, FileNotFoundError):
+            print(f"WARNING: no worker listening on {args.socket}, running locally", file=sys.stderr)
+        else:
+            print(stdout, end="")
+            return status
+
+    return run(command_argv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
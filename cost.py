@@ -0,0 +1,176 @@
+from __future__ import annotations
+
+import math
+import os
+from typing import TYPE_CHECKING, Union
+
+import numpy as np
+
+from IncarConfig import true_values
+
+if TYPE_CHECKING:
+    import pandas as pd
+    from pymatgen.core.structure import Structure
+    from pymatgen.io.vasp.inputs import Potcar
+
+    from AutoVASP import vaspInput
+
+# hbar^2 / 2 m_e in eV Angst^2, turns ENCUT into the radius of the plane wave sphere
+hbar2_over_2m: float = 3.80998212
+
+# a complex double precision plane wave coefficient
+bytes_per_coefficient: int = 16
+
+# cores of one job and of one node, NCORE should not split a band over several nodes
+default_cores: int = 128
+default_cores_per_node: int = 128
+
+# VASP rounds NBANDS up so the bands divide evenly over the band groups, 64 reproduces the Bands columns of resources/slabs*.csv
+default_band_multiple: int = 64
+
+calibration_files: list[str] = [os.path.join(os.path.dirname(os.path.abspath(__file__)), "resources", filename)
+                                for filename in ("slabs.csv", "slabs_soc.csv", "slabs_adsorbates.csv")]
+
+
+def _is_true(value) -> bool:
+    return value is True or str(value).strip().upper() in true_values
+
+
+def _number(value) -> Union[float, None]:
+    '''
+    Returns the value of a numeric INCAR tag, None for missing tags and placeholders such as "set_bands_manually"
+    '''
+    try:
+        return float(str(value).upper().replace("D", "E"))
+    except (TypeError, ValueError):
+        return None
+
+
+def count_electrons(structure: Structure, potcar: Potcar) -> float:
+    '''
+    Returns NELECT of a neutral cell, the sum of the POTCAR ZVALs over all sites
+    '''
+    zvals = {single.element: single.zval for single in potcar}
+
+    return float(sum(amount * zvals[element.symbol] for element, amount in structure.composition.element_composition.items()))
+
+
+def default_nbands(nelect: float, nions: int, noncollinear: bool = False, band_multiple: int = 1) -> int:
+    '''
+    Estimates the NBANDS VASP uses when it is not set: max(NELECT/2 + max(NIONS/2, 3), 0.6 NELECT), doubled for noncollinear runs
+    and rounded up to a multiple of band_multiple (the number of band groups of the run)
+    '''
+    nbands = max(round(nelect + 2) // 2 + max(nions // 2, 3), int(0.6 * nelect))
+    if noncollinear:
+        nbands *= 2
+
+    return int(math.ceil(nbands / band_multiple) * band_multiple)
+
+
+def plane_wave_count(encut: float, volume: float) -> int:
+    '''
+    Number of plane waves with a kinetic energy below encut (eV) in a cell of volume (Angst^3): V k_cut^3 / (6 pi^2)
+    '''
+    k_cut = math.sqrt(encut / hbar2_over_2m)
+
+    return int(volume * k_cut**3 / (6 * math.pi**2))
+
+
+def recommend_parallelization(n_kpoints: int, nbands: int, cores: int = default_cores, cores_per_node: int = default_cores_per_node,
+                              min_cores_per_kpoint: int = 8) -> dict[str, int]:
+    '''
+    Recommends KPAR and NCORE for a job on cores
+    KPAR is the largest divisor of cores that does not exceed the irreducible k-points while leaving min_cores_per_kpoint cores per k-point group,
+    NCORE is the divisor of the cores per group (and of the cores per node) closest to its square root, so there are at least as many bands as band groups
+    '''
+    divisors = [divisor for divisor in range(1, cores + 1) if cores % divisor == 0]
+    kpar = max([divisor for divisor in divisors if divisor <= n_kpoints and cores // divisor >= min(min_cores_per_kpoint, cores)] or [1])
+
+    group = cores // kpar
+    candidates = [divisor for divisor in divisors if group % divisor == 0 and divisor <= cores_per_node and group // divisor <= nbands] or [group]
+    ncore = min(candidates, key=lambda divisor: (abs(math.log(divisor) - 0.5 * math.log(group)), divisor))
+
+    return {"kpar": kpar, "ncore": ncore}
+
+
+def estimate_cost(nions: int, nelect: float, volume: float, encut: float, n_kpoints: int, ispin: int = 1, soc: bool = False,
+                  nbands: Union[int, None] = None, band_multiple: int = default_band_multiple, cores: int = default_cores,
+                  cores_per_node: int = default_cores_per_node) -> dict:
+    '''
+    Estimates the memory and the relative cost of one ionic step of a job
+    The memory is that of the wavefunctions (twice over for the work arrays of the minimizers) and of the subspace matrices, in GB
+    The relative core-hours follow the cost of applying the Hamiltonian (FFTs, N_pw log N_pw per band) and of orthogonalizing the bands (N_bands^2 N_pw)
+    for every irreducible k-point and spin, they are only meaningful compared with each other
+    soc doubles the bands and the spinor components of every plane wave, and replaces ISPIN
+    '''
+    if nbands is None:
+        nbands = default_nbands(nelect, nions, soc, band_multiple)
+    n_plane_waves = plane_wave_count(encut, volume)
+
+    spinors, spins = (2, 1) if soc else (1, ispin)
+    coefficients = n_plane_waves * spinors
+    wavefunctions = n_kpoints * spins * nbands * coefficients * bytes_per_coefficient
+    subspace = 3 * n_kpoints * spins * nbands**2 * bytes_per_coefficient
+    memory_gb = (2 * wavefunctions + subspace) / 1e9
+
+    operations = n_kpoints * spins * (nbands * coefficients * math.log2(max(coefficients, 2)) + nbands**2 * coefficients)
+
+    estimate = {"nions": nions, "nelect": nelect, "nbands": nbands, "n_plane_waves": n_plane_waves, "n_irreducible": n_kpoints,
+                "memory_gb": memory_gb, "relative_core_hours": operations / 1e12}
+    estimate.update(recommend_parallelization(n_kpoints, nbands, cores, cores_per_node))
+
+    return estimate
+
+
+def estimate_job_cost(job: vaspInput, cores: int = default_cores, cores_per_node: int = default_cores_per_node, band_multiple: int = default_band_multiple,
+                      symmetry: bool = True) -> dict:
+    '''
+    Estimates the cost of a vaspInput from its structure, POTCAR, INCAR parameters and k-mesh
+    ENCUT defaults to the largest ENMAX of the POTCAR and NELECT to the sum of the ZVALs, NBANDS is only used when it is a number
+    The irreducible k-points use the Laue group of the structure with symmetry, time reversal only without it, and the full mesh with ISYM = -1
+    or for noncollinear runs with ISYM <= 0, where VASP does not use time reversal either
+    '''
+    from AutoVASP import irreducible_kpoints, laue_group_order
+
+    parameters = {key.upper(): value for key, value in job.parameter_dictionary.items()}
+    soc = _is_true(parameters.get("LSORBIT", False)) or _is_true(parameters.get("LNONCOLLINEAR", False))
+    isym = _number(parameters.get("ISYM"))
+
+    mesh = np.array(job.kpoints.kpts[0], dtype=int)
+    if isym is not None and (isym < 0 or (soc and isym <= 0)):
+        n_kpoints = int(mesh.prod())
+    elif symmetry and (isym is None or isym > 0):
+        n_kpoints = int(irreducible_kpoints(mesh, laue_group_order(job.structure))[0])
+    else:
+        n_kpoints = int(irreducible_kpoints(mesh)[0])
+
+    encut = _number(parameters.get("ENCUT")) or max(single.enmax for single in job.potcar)
+    nelect = _number(parameters.get("NELECT")) or count_electrons(job.structure, job.potcar)
+    nbands = _number(parameters.get("NBANDS"))
+    ispin = int(_number(parameters.get("ISPIN")) or 1)
+
+    return estimate_cost(len(job.structure), nelect, job.structure.volume, encut, n_kpoints, ispin, soc, int(nbands) if nbands else None,
+                         band_multiple, cores, cores_per_node)
+
+
+def cost_dataframe(jobs: list[vaspInput], cores: int = default_cores, cores_per_node: int = default_cores_per_node,
+                   band_multiple: int = default_band_multiple, symmetry: bool = True) -> pd.DataFrame:
+    '''
+    Returns the cost estimate of every job, one row per job
+    '''
+    import pandas as pd
+
+    return pd.DataFrame([estimate_job_cost(job, cores, cores_per_node, band_multiple, symmetry) for job in jobs])
+
+
+def calibrate_band_multiple(csv_files: list[str] = calibration_files, candidates: tuple[int, ...] = (1, 2, 4, 8, 16, 32, 64, 128)) -> dict[int, float]:
+    '''
+    Compares default_nbands with the recorded Bands of finished runs (columns Atoms, Electrons and Bands, files with soc in their name are noncollinear)
+    Returns the fraction of runs reproduced by each candidate band_multiple
+    '''
+    import pandas as pd
+
+    runs = pd.concat([pd.read_csv(csv_file).assign(soc="soc" in os.path.basename(csv_file)) for csv_file in csv_files], ignore_index=True)
+
+    return {multiple: float(np.mean([default_nbands(run.Electrons, run.Atoms, run.soc, multiple) == run.Bands for run in runs.itertuples()]))
+            for multiple in candidates}
@@ -19,8 +19,8 @@ inputs = [vaspInput(structure, job_types["bulk_relaxation_high_prec"]) for struc
 for i,inp in enumerate(inputs):
     inp.write_input_files(names[i], readme=True)
 
-#tar the directories
-import os
-for name in names:
-    os.system(f"tar -cvzf exploratory.tar.gz {names[0]} {names[1]} {names[2]} {names[3]}")
+#archive the directories once, each file can be read back without unpacking the others
+from archive import write_archive
+
+write_archive(names, "exploratory.zip", raw_files=["*"], parse=False)
     
\ No newline at end of file
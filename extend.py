@@ -1,11 +1,8 @@
-from AutoVASP import *
 import sys
 
-#this is a script that will extend a POSCAR or CONTCAR file by a factor of 3 in the xy plane
-
-#read in the file as a command line argument
-structure = structure_from_file(sys.argv[1])
-extended_structure = extend_structure(structure, 3, 3, 1)
+from cli import extend_file
 
-#write the extended structure to a file, the name of the file is the name of the original file with _extended
-extended_structure.to('POSCAR', sys.argv[1] + "_extended")
\ No newline at end of file
+#this is a script that will extend a POSCAR or CONTCAR file by a factor of 3 in the xy plane
+#the extended structure is written to the name of the original file with _extended
+#to extend many files in one go use "python cli.py extend FILES"
+extend_file(sys.argv[1], 3, 3, 1)
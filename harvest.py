@@ -0,0 +1,152 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from typing import Union
+
+import pandas as pd
+
+from AutoVASP import vaspOutput
+
+# files whose changes invalidate a cached result
+signature_files: list[str] = ["vasprun.xml", "CONTCAR", "POSCAR"]
+cache_filename: str = ".autovasp_harvest.sqlite"
+
+
+def find_run_directories(root: str, marker: str = "vasprun.xml") -> list[str]:
+    '''
+    Finds all directories below root that contain a VASP output file
+    '''
+    run_directories = []
+    for directory, subdirectories, files in os.walk(root):
+        subdirectories.sort()
+        if marker in files:
+            run_directories.append(directory)
+
+    return run_directories
+
+
+def harvest_directory(directory: str) -> tuple[str, Union[pd.DataFrame, None], Union[str, None]]:
+    '''
+    Reads the results of a single run directory
+    Returns the directory, the results dataframe and an error message (only one of the last two is set)
+    '''
+    try:
+        df = vaspOutput(directory).results_dataframe()
+    except Exception as error:
+        return directory, None, f"{type(error).__name__}: {error}"
+
+    return directory, df, None
+
+
+def file_signature(directory: str, hash_files: bool = False) -> str:
+    '''
+    Returns a string that changes whenever one of the signature files in a directory changes
+    Uses modification time and size, optionally a sha256 of the contents as well
+    '''
+    signature = []
+    for filename in signature_files:
+        path = os.path.join(directory, filename)
+        if not os.path.exists(path):
+            signature.append([filename, None])
+            continue
+        stat = os.stat(path)
+        entry = [filename, stat.st_mtime_ns, stat.st_size]
+        if hash_files:
+            sha = hashlib.sha256()
+            with open(path, "rb") as f:
+                for block in iter(lambda: f.read(1 << 20), b""):
+                    sha.update(block)
+            entry.append(sha.hexdigest())
+        signature.append(entry)
+
+    return json.dumps(signature)
+
+
+class HarvestCache:
+    '''
+    An SQLite table of harvested rows keyed on the run directory (relative to the campaign root) and its file signature
+    '''
+
+    def __init__(self, filename: str) -> None:
+        self.filename = filename
+        self.connection = sqlite3.connect(filename)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS results (directory TEXT PRIMARY KEY, signature TEXT, row TEXT)")
+
+    def get(self, directory: str, signature: str) -> Union[dict, None]:
+        '''
+        Returns the cached row of a directory if its signature has not changed
+        '''
+        result = self.connection.execute("SELECT signature, row FROM results WHERE directory = ?", (directory,)).fetchone()
+        if result is None or result[0] != signature:
+            return None
+
+        return json.loads(result[1])
+
+    def put(self, directory: str, signature: str, row: dict) -> None:
+        self.connection.execute("INSERT OR REPLACE INTO results VALUES (?, ?, ?)", (directory, signature, json.dumps(row)))
+
+    def close(self) -> None:
+        self.connection.commit()
+        self.connection.close()
+
+
+def harvest(root: str, workers: int = 1, directories: Union[list[str], None] = None, cache: bool = False, hash_files: bool = False) -> pd.DataFrame:
+    '''
+    Collects the results of every run directory below root into a single dataframe
+    The columns are those of vaspOutput.as_dataframe plus vaspOutput.structure_changes, with an extra "directory" column
+    Directories that cannot be read are reported and skipped, they are listed in df.attrs["failures"]
+    With cache=True, rows are stored in root/.autovasp_harvest.sqlite and only new or modified runs are parsed again
+    '''
+    if directories is None:
+        directories = find_run_directories(root)
+
+    rows: dict = {}
+    to_parse = directories
+    if cache:
+        harvest_cache = HarvestCache(os.path.join(root, cache_filename))
+        signatures = {directory: file_signature(directory, hash_files) for directory in directories}
+        for directory in directories:
+            row = harvest_cache.get(os.path.relpath(directory, root), signatures[directory])
+            if row is not None:
+                rows[directory] = pd.DataFrame(row, index=[0])
+        to_parse = [directory for directory in directories if directory not in rows]
+
+    if workers > 1 and len(to_parse) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(to_parse) // (4 * workers))
+            results = list(executor.map(harvest_directory, to_parse, chunksize=chunksize))
+    else:
+        results = [harvest_directory(directory) for directory in to_parse]
+
+    failures = {}
+    for directory, df, error in results:
+        if error is not None:
+            print(f"WARNING: could not harvest {directory} ({error})")
+            failures[directory] = error
+            continue
+        rows[directory] = df
+        if cache:
+            row = {key: value.item() if hasattr(value, "item") else value for key, value in df.iloc[0].items()}
+            harvest_cache.put(os.path.relpath(directory, root), signatures[directory], row)
+
+    if cache:
+        harvest_cache.close()
+
+    frames = []
+    for directory in directories:
+        if directory in rows:
+            df = rows[directory]
+            df.insert(0, "directory", directory)
+            frames.append(df)
+
+    if frames:
+        harvested = pd.concat(frames, ignore_index=True)
+    else:
+        harvested = pd.DataFrame(columns=["directory"])
+    harvested.attrs["failures"] = failures
+
+    return harvested
@@ -0,0 +1,288 @@
+from __future__ import annotations
+
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Iterator, Union
+
+import numpy as np
+import pandas as pd
+
+from harvest import find_run_directories
+
+# lines written by VASP that decide the state of a job
+converged_marker: bytes = b"reached required accuracy"
+finished_marker: bytes = b"General timing and accounting informations for this job"
+energy_pattern = re.compile(rb"TOTEN\s*=\s*(-?\d+\.\d+)")
+error_markers: list[bytes] = [b"VERY BAD NEWS", b"ZBRENT: fatal error", b"Error EDDDAV", b"EDWAV: internal error", b"LAPACK: Routine ZPOTRF failed"]
+
+float_pattern = re.compile(rb"-?\d+\.\d+")
+
+# one record per ionic step, energy is TOTEN (free energy) and stress is XX YY ZZ XY YZ ZX in kB
+ionic_step_dtype = np.dtype([("step", np.int64), ("energy", np.float64), ("energy_sigma_0", np.float64), ("max_force", np.float64),
+                             ("drift", np.float64, (3,)), ("stress", np.float64, (6,))])
+
+# tags read from the header, with the pattern that captures their value
+header_patterns: dict[str, re.Pattern] = {
+    "nions": re.compile(rb"NIONS\s*=\s*(\d+)"),
+    "nelect": re.compile(rb"NELECT\s*=\s*(-?\d+\.?\d*)"),
+    "nbands": re.compile(rb"NBANDS\s*=\s*(\d+)"),
+    "nkpts": re.compile(rb"NKPTS\s*=\s*(\d+)"),
+    "nsw": re.compile(rb"NSW\s*=\s*(-?\d+)"),
+    "ibrion": re.compile(rb"IBRION\s*=\s*(-?\d+)"),
+}
+
+def read_reverse_lines(filename: str, block_size: int = 1 << 16) -> Iterator[bytes]:
+    '''
+    Yields the lines of a file from last to first, reading it backwards in blocks
+    '''
+    with open(filename, "rb") as f:
+        position = f.seek(0, os.SEEK_END)
+        remainder = b""
+        while position > 0:
+            size = min(block_size, position)
+            position -= size
+            f.seek(position)
+            lines = (f.read(size) + remainder).split(b"\n")
+            # the first line of the block may continue in the previous block
+            remainder = lines.pop(0)
+            yield from reversed(lines)
+        yield remainder
+
+
+def read_outcar_header(filename: str, max_bytes: int = 1 << 24) -> dict:
+    '''
+    Reads NIONS, NELECT, NBANDS, NKPTS, NSW and IBRION from the top of an OUTCAR
+    Stops at the first electronic iteration, or after max_bytes, so large OUTCARs are not read in full
+    Tags that are not found are None
+    '''
+    header = {key: None for key in header_patterns}
+    with open(filename, "rb") as f:
+        n_bytes = 0
+        for line in f:
+            n_bytes += len(line)
+            if b"Iteration" in line or n_bytes > max_bytes:
+                break
+            for key, pattern in header_patterns.items():
+                if header[key] is None:
+                    match = pattern.search(line)
+                    if match:
+                        header[key] = float(match.group(1)) if key == "nelect" else int(match.group(1))
+
+    return header
+
+
+def read_outcar_tail(filename: str, block_size: int = 1 << 16) -> dict:
+    '''
+    Reads an OUTCAR backwards up to the last TOTEN line
+    Everything that decides the state of a finished or running job is written after that line
+    '''
+    tail = {"energy": None, "converged": False, "finished": False, "error": None}
+    for line in read_reverse_lines(filename, block_size):
+        if finished_marker in line:
+            tail["finished"] = True
+        elif converged_marker in line:
+            tail["converged"] = True
+        elif tail["error"] is None and any(marker in line for marker in error_markers):
+            tail["error"] = line.strip().decode(errors="replace")
+        elif b"TOTEN" in line:
+            match = energy_pattern.search(line)
+            if match:
+                tail["energy"] = float(match.group(1))
+                break
+
+    return tail
+
+
+def job_state(directory: str, block_size: int = 1 << 16, stale_after: Union[float, None] = None) -> dict:
+    '''
+    Returns the state of the job in directory together with the final TOTEN and the header tags
+    The status is "not started" without an OUTCAR, "converged" if a relaxation reached the required accuracy or a single point run finished,
+    "failed" if VASP reported an error or finished without converging, and "running" otherwise
+    With stale_after (seconds), an unfinished job whose OUTCAR has not changed for that long is "failed" as well
+    relaxation is whether the job moves the ions (NSW > 0 and IBRION != -1), None before it started
+    '''
+    filename = os.path.join(directory, "OUTCAR")
+    state = {"directory": directory, "status": "not started", "relaxation": None, "energy": None, "nions": None, "nelect": None, "nbands": None, "nkpts": None,
+             "error": None}
+    if not os.path.exists(filename) or os.path.getsize(filename) == 0:
+        return state
+
+    header = read_outcar_header(filename)
+    tail = read_outcar_tail(filename, block_size)
+    state.update({key: header[key] for key in ("nions", "nelect", "nbands", "nkpts")})
+    state["energy"] = tail["energy"]
+    state["error"] = tail["error"]
+
+    relaxation = header["nsw"] not in (None, 0) and header["ibrion"] not in (None, -1)
+    state["relaxation"] = relaxation
+    if tail["converged"] or (tail["finished"] and not relaxation):
+        state["status"] = "converged"
+    elif tail["error"] is not None:
+        state["status"] = "failed"
+    elif tail["finished"]:
+        state["status"] = "failed"
+        state["error"] = "finished without reaching the required accuracy"
+    elif stale_after is not None and time.time() - os.path.getmtime(filename) > stale_after:
+        state["status"] = "failed"
+        state["error"] = f"OUTCAR not updated for more than {stale_after:g} s"
+    else:
+        state["status"] = "running"
+
+    return state
+
+
+def find_job_directories(root: str) -> list[str]:
+    '''
+    Finds all directories below root that hold the input (INCAR) or output (OUTCAR) of a job
+    '''
+    directories = set(find_run_directories(root, marker="INCAR")) | set(find_run_directories(root, marker="OUTCAR"))
+
+    return sorted(directories)
+
+
+def scan_jobs(root: str = "./", directories: Union[list[str], None] = None, workers: int = 1, stale_after: Union[float, None] = None,
+              block_size: int = 1 << 16) -> pd.DataFrame:
+    '''
+    Returns a dataframe with the state of every job below root (or of the given directories), one row per directory
+    '''
+    if directories is None:
+        directories = find_job_directories(root)
+
+    if workers > 1 and len(directories) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(directories) // (4 * workers))
+            states = list(executor.map(job_state, directories, [block_size] * len(directories), [stale_after] * len(directories), chunksize=chunksize))
+    else:
+        states = [job_state(directory, block_size, stale_after) for directory in directories]
+
+    df = pd.DataFrame(states, columns=["directory", "status", "relaxation", "energy", "nions", "nelect", "nbands", "nkpts", "error"])
+
+    return df
+
+
+class OutcarStream:
+    '''
+    Incremental OUTCAR reader that yields one record (ionic_step_dtype) per completed ionic step
+    Each call to read only parses the bytes added since the previous call, so a running relaxation can be followed like tail -f
+    offset is the byte offset just after the last completed step: save it together with step to resume with OutcarStream(filename, offset, step)
+    '''
+
+    def __init__(self, filename: str, offset: int = 0, step: int = 0) -> None:
+        self.filename = filename
+        self.offset = offset
+        self.step = step
+        self.finished = False
+        self._position = offset
+        self._reset_step()
+
+    def _reset_step(self) -> None:
+        self._stress = np.full(6, np.nan)
+        self._drift = np.full(3, np.nan)
+        self._max_force = np.nan
+        self._forces: Union[list[np.ndarray], None] = None
+        self._energy: Union[float, None] = None
+        self._in_summary = False
+
+    def _parse_line(self, line: bytes) -> Union[tuple, None]:
+        '''
+        Updates the state of the current ionic step, returns a record when the step is complete
+        '''
+        if self._forces is not None:
+            if line.lstrip().startswith(b"---"):
+                if self._forces:
+                    self._max_force = float(np.linalg.norm(np.array(self._forces), axis=1).max())
+                    self._forces = None
+            else:
+                self._forces.append(np.array(float_pattern.findall(line)[3:6], dtype=float))
+        elif b"TOTAL-FORCE" in line:
+            self._forces = []
+        elif line.lstrip().startswith(b"in kB"):
+            self._stress = np.array(float_pattern.findall(line)[:6], dtype=float)
+        elif b"total drift:" in line:
+            self._drift = np.array(float_pattern.findall(line)[:3], dtype=float)
+        elif b"FREE ENERGIE OF THE ION-ELECTRON SYSTEM" in line:
+            self._in_summary = True
+        elif self._in_summary and b"TOTEN" in line:
+            self._energy = float(energy_pattern.search(line).group(1))
+        elif self._in_summary and b"energy(sigma->0)" in line:
+            self.step += 1
+            record = (self.step, self._energy, float(float_pattern.findall(line)[-1]), self._max_force, self._drift, self._stress)
+            self._reset_step()
+            return record
+        elif finished_marker in line:
+            self.finished = True
+
+        return None
+
+    def read(self) -> np.ndarray:
+        '''
+        Returns the ionic steps completed since the last call, lines that are still being written are left for the next call
+        The file is read line by line, so memory does not grow with the size of the OUTCAR
+        If the OUTCAR is shorter than the position already read (VASP was restarted), it is read again from the start
+        '''
+        if os.path.getsize(self.filename) < self._position:
+            self.offset = self._position = self.step = 0
+            self.finished = False
+            self._reset_step()
+
+        records = []
+        with open(self.filename, "rb") as f:
+            f.seek(self._position)
+            position = self._position
+            for line in f:
+                if not line.endswith(b"\n"):
+                    break
+                position += len(line)
+                record = self._parse_line(line)
+                if record is not None:
+                    records.append(record)
+                    self.offset = position
+        self._position = position
+
+        return np.array(records, dtype=ionic_step_dtype)
+
+    def __iter__(self) -> Iterator[np.void]:
+        yield from self.read()
+
+    def follow(self, interval: float = 5.0, timeout: Union[float, None] = None, stop: Union[Callable[[np.ndarray], bool], None] = None) -> Iterator[np.void]:
+        '''
+        Yields ionic steps as they are written until the job finishes, the file has not grown for timeout seconds,
+        or stop returns True for the array of all steps read so far (e.g. stop=relaxation_stalled)
+        '''
+        steps = np.empty(0, dtype=ionic_step_dtype)
+        last_update = time.monotonic()
+        while True:
+            new_steps = self.read() if os.path.exists(self.filename) else np.empty(0, dtype=ionic_step_dtype)
+            yield from new_steps
+            if len(new_steps):
+                last_update = time.monotonic()
+                steps = np.concatenate([steps, new_steps])
+                if stop is not None and stop(steps):
+                    return
+            if self.finished or (timeout is not None and time.monotonic() - last_update > timeout):
+                return
+            time.sleep(interval)
+
+
+def relaxation_stalled(steps: np.ndarray, max_drift: float = 1.0, window: int = 10, energy_tolerance: float = 1e-4) -> Union[str, None]:
+    '''
+    Checks the ionic steps of a relaxation for signs that it will not converge
+    Returns the reason if the total drift exceeds max_drift (eV/Angst) or the energy changed by less than energy_tolerance (eV) over the last window steps
+    while the forces are not decreasing, otherwise None
+    '''
+    if len(steps) == 0:
+        return None
+
+    drift = np.abs(steps["drift"][-1]).max()
+    if drift > max_drift:
+        return f"total drift of {drift:g} eV/Angst at step {steps['step'][-1]}"
+
+    if len(steps) > window:
+        recent = steps[-window - 1:]
+        energy_change = np.abs(np.diff(recent["energy"])).max()
+        if energy_change < energy_tolerance and recent["max_force"][-1] >= recent["max_force"][0]:
+            return f"energy changed by less than {energy_tolerance:g} eV over {window} steps without lowering the forces"
+
+    return None
@@ -3,7 +3,13 @@
 #this is a script that archives all directories in the current directory that contain an OUTCAR file that contains "reached required accuracy"
 
 #find all directories that contain an OUTCAR file that contains "reached required accuracy" and save these directories to an array
-dirs=($(find . -name "OUTCAR" -exec grep -l "reached required accuracy" {} \; | sed 's/\/OUTCAR//g' | sed 's/^\.\///g' ))
+#if AUTOVASP points at the AutoVASP directory, the job-state scanner only reads the end of each OUTCAR instead of grepping the whole file
+#--relaxation-only keeps finished DOS and band runs out, as they never print "reached required accuracy"
+if [ -n "$AUTOVASP" ]; then
+    dirs=($(python3 "$AUTOVASP"/cli.py status . --status converged --relaxation-only --paths --workers 4))
+else
+    dirs=($(find . -name "OUTCAR" -exec grep -l "reached required accuracy" {} \; | sed 's/\/OUTCAR//g' | sed 's/^\.\///g' ))
+fi
 
 basename=$(basename "$PWD")
 
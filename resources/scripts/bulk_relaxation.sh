@@ -244,6 +244,10 @@ for dir in "${finished_job_dirs[@]}"; do
     ( cd "$dir" || exit
     #get the directory name and save as job_type
     job_type=$(basename "$PWD")
+    if [ -n "$AUTOVASP" ]; then
+    #read the number of atoms, final energy, number of electrons, bands and k-points in one pass over the header and the end of OUTCAR
+    IFS=, read -r atoms energy electrons bands kpoints <<< "$(python3 "$AUTOVASP"/cli.py status . --columns nions,energy,nelect,nbands,nkpts)"
+    else
     #get the number of atoms
     atoms=$(grep "NIONS" OUTCAR | awk '{print $12}')
     #Get the final energy
@@ -254,6 +258,7 @@ for dir in "${finished_job_dirs[@]}"; do
     bands=$(grep "NBANDS" OUTCAR | awk '{print $15}')
     #Get the number of k-points
     kpoints=$(grep "NKPTS" OUTCAR | awk '{print $4}')
+    fi
     #Get the fourth line of the KPOINTS file
     k=$(sed -n '4p' KPOINTS)
     #Get the Kx, Ky, and Kz values
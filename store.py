@@ -0,0 +1,97 @@
+from __future__ import annotations
+
+import json
+import os
+import sqlite3
+from contextlib import contextmanager
+from typing import Iterator, Union
+
+from pymatgen.analysis.structure_matcher import StructureMatcher
+from pymatgen.core.structure import Structure
+
+from AutoVASP import structure_fingerprint
+
+
+class StructureStore:
+    '''
+    A content-addressed store of structures, backed by an SQLite file
+    Structures are keyed on structure_fingerprint plus a tag (e.g. the job type), so the same structure can be used for different jobs
+    With match=True, structures that StructureMatcher considers equivalent (same reduced formula and site count bucket) are also duplicates
+    A new connection is opened for every operation, so a store can be shared with worker processes
+    '''
+
+    def __init__(self, filename: str, match: bool = False, matcher: Union[StructureMatcher, None] = None) -> None:
+        self.filename = filename
+        self.match = match
+        self.matcher = matcher if matcher is not None else StructureMatcher()
+        directory = os.path.dirname(filename)
+        if directory and not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as connection:
+            connection.execute("CREATE TABLE IF NOT EXISTS structures (fingerprint TEXT, tag TEXT, bucket TEXT, directory TEXT, structure TEXT, PRIMARY KEY (fingerprint, tag))")
+            connection.execute("CREATE INDEX IF NOT EXISTS buckets ON structures (bucket, tag)")
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        connection = sqlite3.connect(self.filename, timeout=60)
+        try:
+            with connection:
+                yield connection
+        finally:
+            connection.close()
+
+    @staticmethod
+    def bucket(structure: Structure) -> str:
+        '''
+        Structures can only match if they share a bucket
+        '''
+        return f"{structure.composition.reduced_formula}_{structure.num_sites}"
+
+    def lookup(self, structure: Structure, tag: str = "") -> Union[str, None]:
+        '''
+        Returns the directory of a stored duplicate of structure, or None
+        '''
+        with self._connect() as connection:
+            row = connection.execute("SELECT directory FROM structures WHERE fingerprint = ? AND tag = ?", (structure_fingerprint(structure), tag)).fetchone()
+            if row is not None:
+                return row[0]
+            if not self.match:
+                return None
+            candidates = connection.execute("SELECT directory, structure FROM structures WHERE bucket = ? AND tag = ?", (self.bucket(structure), tag)).fetchall()
+
+        for directory, stored in candidates:
+            if self.matcher.fit(structure, Structure.from_dict(json.loads(stored))):
+                return directory
+
+        return None
+
+    def register(self, structure: Structure, directory: str, tag: str = "") -> str:
+        '''
+        Adds structure to the store under directory unless a duplicate is already stored
+        Returns the directory that owns the structure, which is directory itself if the structure is new
+        '''
+        existing = self.lookup(structure, tag) if self.match else None
+        if existing is not None:
+            return existing
+
+        fingerprint = structure_fingerprint(structure)
+        with self._connect() as connection:
+            inserted = connection.execute("INSERT OR IGNORE INTO structures VALUES (?, ?, ?, ?, ?)",
+                                          (fingerprint, tag, self.bucket(structure), directory, json.dumps(structure.as_dict()))).rowcount
+            if inserted:
+                return directory
+            # another job registered the same structure first
+            return connection.execute("SELECT directory FROM structures WHERE fingerprint = ? AND tag = ?", (fingerprint, tag)).fetchone()[0]
+
+    def unregister(self, structure: Structure, directory: str, tag: str = "") -> bool:
+        '''
+        Removes structure from the store if directory owns it, e.g. because writing its job failed
+        Returns whether an entry was removed
+        '''
+        with self._connect() as connection:
+            return connection.execute("DELETE FROM structures WHERE fingerprint = ? AND tag = ? AND directory = ?",
+                                      (structure_fingerprint(structure), tag, directory)).rowcount > 0
+
+    def __len__(self) -> int:
+        with self._connect() as connection:
+            return connection.execute("SELECT COUNT(*) FROM structures").fetchone()[0]
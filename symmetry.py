@@ -0,0 +1,107 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from functools import cached_property
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from pymatgen.core.structure import Structure
+    from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+
+# defaults of Structure.get_space_group_info, so cached results match the values reported before
+default_symprec: float = 0.01
+default_angle_tolerance: float = 5.0
+
+
+class SymmetryInfo:
+    '''
+    Result of one spglib run on a structure: space group symbol and number, crystal system and, on first use, the standard primitive and conventional cells
+    The results are shared by every caller of the cache, so the cells are returned as copies that can be changed in place
+    '''
+
+    def __init__(self, structure: Structure, symprec: float = default_symprec, angle_tolerance: float = default_angle_tolerance) -> None:
+        from pymatgen.symmetry.analyzer import SpacegroupAnalyzer
+
+        # the analyzer keeps its structure, a copy stops later changes to the caller's structure from reaching the cache
+        self.analyzer: SpacegroupAnalyzer = SpacegroupAnalyzer(structure.copy(), symprec=symprec, angle_tolerance=angle_tolerance)
+        self.symbol: str = self.analyzer.get_space_group_symbol()
+        self.number: int = self.analyzer.get_space_group_number()
+        self.crystal_system: str = self.analyzer.get_crystal_system()
+
+    @property
+    def space_group_info(self) -> tuple[str, int]:
+        return self.symbol, self.number
+
+    @cached_property
+    def _primitive(self) -> Structure:
+        return self.analyzer.get_primitive_standard_structure()
+
+    @cached_property
+    def _conventional(self) -> Structure:
+        return self.analyzer.get_conventional_standard_structure()
+
+    @property
+    def primitive(self) -> Structure:
+        return self._primitive.copy()
+
+    @property
+    def conventional(self) -> Structure:
+        return self._conventional.copy()
+
+
+class SymmetryCache:
+    '''
+    Least recently used cache of SymmetryInfo keyed on structure_fingerprint (plus the magnetic moments, which spglib uses) and the tolerances
+    At most maxsize results are kept, so batch runs over many structures do not grow without limit
+    '''
+
+    def __init__(self, maxsize: int = 256) -> None:
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._cache: OrderedDict[tuple, SymmetryInfo] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._cache.clear()
+            self.hits = self.misses = 0
+
+    @staticmethod
+    def key(structure: Structure, symprec: float, angle_tolerance: float) -> tuple:
+        from AutoVASP import structure_fingerprint
+
+        magmoms = tuple(round(float(magmom), 4) for magmom in structure.site_properties["magmom"]) if "magmom" in structure.site_properties else None
+
+        return structure_fingerprint(structure), magmoms, symprec, angle_tolerance
+
+    def get(self, structure: Structure, symprec: float = default_symprec, angle_tolerance: float = default_angle_tolerance) -> SymmetryInfo:
+        key = self.key(structure, symprec, angle_tolerance)
+        with self._lock:
+            if key in self._cache:
+                self.hits += 1
+                self._cache.move_to_end(key)
+                return self._cache[key]
+            self.misses += 1
+
+        info = SymmetryInfo(structure, symprec, angle_tolerance)
+        with self._lock:
+            self._cache[key] = info
+            while len(self._cache) > self.maxsize:
+                self._cache.popitem(last=False)
+
+        return info
+
+
+symmetry_cache = SymmetryCache()
+
+
+def symmetry_info(structure: Structure, symprec: float = default_symprec, angle_tolerance: float = default_angle_tolerance) -> SymmetryInfo:
+    '''
+    Returns the symmetry of a structure from the shared cache, spglib only runs for structures (and tolerances) it has not seen recently
+    '''
+    return symmetry_cache.get(structure, symprec, angle_tolerance)
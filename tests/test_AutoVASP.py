@@ -1,7 +1,11 @@
+import json
 import os
+import shutil
 
+import numpy as np
 import pandas as pd
 from pymatgen.core.structure import Molecule, Structure
+from pymatgen.io.vasp.inputs import Incar, Kpoints, Poscar
 
 from AutoVASP import *
 
@@ -51,14 +55,258 @@ def test_AutoVASP():
     #test if vaspInput from_directory returns a vaspInput object
     assert isinstance(vaspInput.from_directory(directory=dir), vaspInput)
 
+    #test if the k-path is only computed when it is needed
+    lazy_input = vaspInput(test_structure, test_param_dict)
+    assert "kpath" not in lazy_input.__dict__
+    assert lazy_input.kpath is lazy_input.kpath
+
     #test if vaspInput as_dataframe returns a pandas dataframe without empty columns    
     assert isinstance(vaspInput(test_structure,test_param_dict).as_dataframe(), pd.DataFrame)
     assert len(vaspInput(test_structure,test_param_dict).as_dataframe().columns) > 0
 
 
+def test_potcar_store(tmp_path):
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    test_param_dict: dict = {"SYSTEM": "test", "ENCUT": 500}
+
+    #test if the POTCAR is built once per set of potentials
+    assert make_potcar(test_structure) is make_potcar(test_structure.copy())
+
+    #test if a shared POTCAR store hard links the same file into each directory
+    store = os.path.join(tmp_path, "potcar_store")
+    for job in ("job_1", "job_2"):
+        vaspInput(test_structure, test_param_dict).write_input_files(os.path.join(tmp_path, job), potcar_store=store)
+    assert os.path.samefile(os.path.join(tmp_path, "job_1", "POTCAR"), os.path.join(tmp_path, "job_2", "POTCAR"))
+    assert len(os.listdir(store)) == 1
+
+
+def test_write_job_batch(tmp_path):
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    jobs = [(test_structure, job_type, os.path.join(tmp_path, job_type)) for job_type in ("bulk_relaxation_low_prec", "dos")]
+    jobs.append((test_structure, "not_a_job_type", os.path.join(tmp_path, "missing")))
+
+    manifest = write_job_batch(jobs, workers=2)
+
+    #test if the manifest has one row per job and failures do not stop the batch
+    assert isinstance(manifest, pd.DataFrame)
+    assert list(manifest["status"]) == ["written", "written", "failed"]
+    assert manifest["files"][0] == "INCAR,KPATH,KPOINTS,POSCAR,POTCAR"
+
+    #test if the batch writes the same files as write_job_files
+    write_job_files(test_structure, "dos", os.path.join(tmp_path, "serial"))
+    for filename in ("INCAR", "KPOINTS", "POSCAR", "POTCAR"):
+        with open(os.path.join(tmp_path, "dos", filename)) as f1, open(os.path.join(tmp_path, "serial", filename)) as f2:
+            assert f1.read() == f2.read()
+
+
+def test_adsorb_many():
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    test_adsorbate: Molecule = Molecule.from_file("tests/H2O.xyz")
+    hydrogen = Molecule(["H"], [[0, 0, 0]])
+
+    adsorbed = adsorb_many(test_structure, [test_adsorbate, hydrogen], min_z=1.0)
+
+    #test if every adsorbate is placed on the same symmetry-unique sites
+    assert list(adsorbed) == ["H2O", "H"]
+    assert len(adsorbed["H2O"]) == len(adsorbed["H"]) > 0
+    assert len(adsorbed["H"]) <= len(addAdsorbate(test_structure, hydrogen))
+
+    #test if atoms below min_z are frozen
+    for ads_struct in adsorbed["H"]:
+        frozen = [not any(dof) for dof in ads_struct.site_properties["selective_dynamics"]]
+        assert frozen == list(ads_struct.cart_coords[:, 2] < 1.0)
+
+    #test if the site tolerance is in Angst, independent of the length of the cell
+    from pymatgen.core.lattice import Lattice
+    tall = Structure(Lattice.tetragonal(3.0, 100.0), ["Cu"], [[0, 0, 0]])
+    sites = [np.array([0.7, 0.4, 50.0]), np.array([0.7, 0.4, 50.3]), np.array([0.7, 0.4, 50.05])]
+    assert len(symmetry_unique_sites(tall, sites)) == 2
+
+    #test if only counts of one are dropped from the names and repeated formulas are refused
+    from AutoVASP import _name_adsorbates
+    assert list(_name_adsorbates([Molecule(["C"] * 5 + ["H"] * 11, np.arange(48).reshape(16, 3)), hydrogen])) == ["H11C5", "H"]
+    try:
+        adsorb_many(test_structure, [hydrogen, hydrogen.copy()])
+        assert False
+    except ValueError:
+        pass
+
+
+def test_freeze_structure():
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    z = test_structure.cart_coords[:, 2]
+
+    #test if sites below min_z get the requested degrees of freedom
+    frozen = freeze_structure(test_structure.copy(), 1.0)
+    assert frozen.site_properties["selective_dynamics"] == [[False] * 3 if z_i < 1.0 else [True] * 3 for z_i in z]
+
+    #test if fractional and layer criteria agree with the Cartesian one
+    fractional = freeze_structure(test_structure.copy(), 1.0 / test_structure.lattice.c, fractional=True)
+    layers = freeze_structure(test_structure.copy(), n_layers=1)
+    assert fractional.site_properties == frozen.site_properties == layers.site_properties
+
+    #test if layers of a slab are grouped on Cartesian heights with fractional as well
+    slab = Structure.from_file("bs_bulk.vasp")
+    cartesian_layers = freeze_structure(slab.copy(), n_layers=2)
+    fractional_layers = freeze_structure(slab.copy(), n_layers=2, fractional=True)
+    assert fractional_layers.site_properties == cartesian_layers.site_properties
+    assert 0 < sum(not any(dof) for dof in fractional_layers.site_properties["selective_dynamics"]) < len(slab)
+
+    #test if raw coordinate arrays and Poscar objects can be frozen
+    assert selective_dynamics_mask(test_structure.cart_coords, 1.0).tolist() == frozen.site_properties["selective_dynamics"]
+    poscar = freeze_structure(Poscar(test_structure.copy()), 1.0, dof=[True, True, False])
+    assert list(poscar.selective_dynamics[0]) == [True, True, False]
+
+
+def test_slabs_for_indices(tmp_path, monkeypatch):
+    import AutoVASP
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    indices = [[0, 0, 1], [1, 1, 1]]
+
+    #test if the fingerprint does not depend on site order
+    assert structure_fingerprint(test_structure) == structure_fingerprint(Structure.from_sites(test_structure.sites[::-1]))
+
+    #test if the parallel sweep gives the same slabs as slabs_from_structure
+    slabs = slabs_for_indices(test_structure, indices, workers=2, cache_dir=str(tmp_path), min_slab_size=5, min_vacuum_size=5)
+    assert list(slabs) == [(0, 0, 1), (1, 1, 1)]
+    assert slabs[(1, 1, 1)] == slabs_from_structure(test_structure, [1, 1, 1], min_slab_size=5, min_vacuum_size=5)
+
+    #test if a second sweep only generates the index that is not cached
+    generated = []
+    generate_slabs = AutoVASP._generate_slabs
+    monkeypatch.setattr(AutoVASP, "_generate_slabs", lambda structure, index, **kwargs: generated.append(index) or generate_slabs(structure, index, **kwargs))
+    cached = slabs_for_indices(test_structure, indices + [[1, 1, 0]], cache_dir=str(tmp_path), min_slab_size=5, min_vacuum_size=5)
+    assert generated == [(1, 1, 0)]
+    assert cached[(0, 0, 1)] == slabs[(0, 0, 1)]
+    assert "selective_dynamics" in cached[(0, 0, 1)][0].site_properties
+
+    #test if indices whose digits run together get their own cache files
+    monkeypatch.setattr(AutoVASP, "_generate_slabs", lambda structure, index, **kwargs: generated.append(index) or [])
+    slabs_for_indices(test_structure, [[1, 10, 0]], cache_dir=str(tmp_path), min_slab_size=5, min_vacuum_size=5)
+    slabs_for_indices(test_structure, [[11, 0, 0]], cache_dir=str(tmp_path), min_slab_size=5, min_vacuum_size=5)
+    assert generated[-2:] == [(1, 10, 0), (11, 0, 0)]
+
+
+def test_structures_from_mpi_codes(tmp_path):
+    from types import SimpleNamespace
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    requests = []
+
+    def search(material_ids, fields):
+        requests.append(material_ids)
+        return [SimpleNamespace(material_id=material_id, structure=test_structure) for material_id in material_ids if material_id != "mp-0"]
+
+    client = SimpleNamespace(materials=SimpleNamespace(summary=SimpleNamespace(search=search)))
+    cache_dir = str(tmp_path)
+
+    #test if all missing codes are fetched in one request and then served from the cache
+    structures = structures_from_mpi_codes(["mp-1", "2"], cache_dir=cache_dir, client=client)
+    assert list(structures) == ["mp-1", "mp-2"]
+    assert structure_from_mpi_code("1", None, cache_dir=cache_dir, client=client) == structures["mp-1"]
+    assert requests == [["mp-1", "mp-2"]]
+
+    #test if codes that cannot be found raise
+    try:
+        structures_from_mpi_codes(["mp-0"], cache_dir=cache_dir, client=client)
+        assert False
+    except ValueError:
+        pass
+
+    #test if a bundle can be used instead of the network
+    with open(os.path.join(tmp_path, "bundle.json"), "w") as f:
+        json.dump({"mp-3": test_structure.as_dict()}, f)
+    assert seed_mp_cache(os.path.join(tmp_path, "bundle.json"), cache_dir=cache_dir) == ["mp-3"]
+    assert structures_from_mpi_codes(["mp-3"], cache_dir=cache_dir, offline=True)["mp-3"] == test_structure
+
+
+def test_vaspOutput():
+    # output files are only read when they are first accessed
+    output_dir = "Bi2Se3_331_slab_relaxation_med_prec"
+    output = vaspOutput(output_dir)
+
+    #test if a directory without any output files can still be opened
+    assert isinstance(output.incar, Incar)
+    assert "vasprun" not in output.__dict__
+    assert "outcar" not in output.__dict__
+
+    #test if the parsed files are cached on the object
+    assert output.initial_structure is output.initial_structure
+
+
+def test_vasprun_summary():
+    # the streaming summary should agree with a full Vasprun parse
+    output = vaspOutput("tests/vasp_run")
+    summary = read_vasprun_summary("tests/vasp_run/vasprun.xml")
+
+    assert summary["final_energy"] == output.vasprun.final_energy
+    assert summary["final_structure"] == output.vasprun.final_structure
+    assert summary["kpoint_divisions"] == (4, 4, 4)
+    assert summary["n_kpoints"] == len(output.vasprun.actual_kpoints)
+
+    #test if as_dataframe gives the same result with and without the full parse
+    pd.testing.assert_frame_equal(output.as_dataframe(), output.as_dataframe(full_parse=True))
+
+
+def test_plan_kpoints():
+    structures = [Structure.from_file("tests/POSCAR"), Structure.from_file("bs_bulk.vasp")]
+    lattices = np.array([structure.lattice.matrix for structure in structures])
+    plan = plan_kpoints(lattices)
+
+    #test if every mesh is integer and the planned mesh is the one written to KPOINTS and reported by as_dataframe
+    assert plan["mesh"].dtype.kind == "i"
+    assert recommended_kpoints(structures[0])["kpoints"] == [14, 14, 14]
+    for structure, mesh in zip(structures, plan["mesh"]):
+        job = vaspInput(structure, job_types["bulk_relaxation_med_prec"])
+        assert Kpoints.from_str(job.render_input_files(include_potcar=False)["KPOINTS"]).kpts[0] == tuple(mesh)
+        assert list(job.as_dataframe()[["k_x", "k_y", "k_z"]].iloc[0]) == list(mesh)
+
+    #test if the default mesh is the one pymatgen writes and the reciprocal mesh is opt-in
+    for structure in structures:
+        assert str(make_kpoints(structure)) == str(Kpoints.automatic_density_by_lengths(structure, [50, 50, 50], force_gamma=True))
+    assert recommended_kpoints(structures[1])["kpoints"] == [12, 12, 2]
+    assert recommended_kpoints(structures[1], method="reciprocal")["kpoints"] == [14, 14, 2]
+    assert make_kpoints(structures[1], method="reciprocal").kpts[0] == (14, 14, 2)
+
+    #test if the irreducible estimate is exact with time reversal only and shrinks with the cubic Laue group
+    assert plan["n_irreducible"][0] == (14**3 + 8) // 2
+    assert laue_group_order(structures[0]) == 48
+    df = plan_structure_kpoints(structures, symmetry=True)
+    assert list(df["n_kpoints"]) == list(plan["n_kpoints"])
+    assert (df["n_irreducible"] < plan["n_irreducible"]).all()
+
+
+def test_stage_files(tmp_path):
+    run_dir = os.path.join(tmp_path, "run")
+    shutil.copytree("tests/vasp_run", run_dir)
+
+    #test if the follow-up directory gets the relaxed structure as its POSCAR
+    staged = vaspOutput(run_dir).prepare_dos_directory()
+    assert staged["POSCAR"] == "copy"
+    assert staged["WAVECAR"] == "missing"
+    with open(os.path.join(run_dir, "CONTCAR")) as f1, open(os.path.join(run_dir, "DOS", "POSCAR")) as f2:
+        assert f1.read() == f2.read()
+
+    #test if identical files are not staged twice
+    assert vaspOutput(run_dir).prepare_dos_directory()["vasprun.xml"] == "skipped"
+
+    #test if only read-only inputs are linked and the files VASP rewrites are copied
+    staged = vaspOutput(run_dir).prepare_band_directory(mode="hard")
+    assert staged["KPOINTS"] == "hard" and staged["vasprun.xml"] == "copy"
+    assert os.path.samefile(os.path.join(run_dir, "KPOINTS"), os.path.join(run_dir, "BAND", "KPOINTS"))
+    assert not os.path.samefile(os.path.join(run_dir, "vasprun.xml"), os.path.join(run_dir, "BAND", "vasprun.xml"))
+
+    #test if staging in copy mode replaces existing links
+    os.remove(os.path.join(run_dir, "BAND", "vasprun.xml"))
+    os.link(os.path.join(run_dir, "vasprun.xml"), os.path.join(run_dir, "BAND", "vasprun.xml"))
+    assert stage_file(os.path.join(run_dir, "vasprun.xml"), os.path.join(run_dir, "BAND", "vasprun.xml")) == "copy"
+    assert stage_file(os.path.join(run_dir, "KPOINTS"), os.path.join(run_dir, "BAND", "KPOINTS")) == "copy"
+    assert not os.path.samefile(os.path.join(run_dir, "KPOINTS"), os.path.join(run_dir, "BAND", "KPOINTS"))
+
+
 if __name__ == "__main__":
     test_AutoVASP()
+    test_vaspOutput()
+    test_vasprun_summary()
     os.system("rm -r write_input_files_test")
-    os.system("rm KPATH.av")
 
 
@@ -0,0 +1,46 @@
+from AutoVASP import check_for_valid_tags, job_types
+from IncarConfig import get_incar_dict, get_job_templates, load_incar_tags, resolve_template, validate_incar_dict
+
+
+def test_validate_incar_dict():
+    #test if the tag list is only read once
+    assert load_incar_tags() is load_incar_tags()
+    assert "ENCUT" in load_incar_tags()
+
+    #test if every job template is valid
+    for job_type, parameters in job_types.items():
+        assert check_for_valid_tags(parameters), job_type
+    templates = get_job_templates()
+    for job_type in templates:
+        assert validate_incar_dict(get_incar_dict(job_type, templates)) == []
+
+    #test if all problems are reported, not only the first one
+    problems = validate_incar_dict({"ENCUT": -1, "FOO": 1, "ISPIN": 3, "LWAVE": "yes", "NBANDS": "{bands}", "MAGMOM": [1, 1]}, raise_error=False)
+    assert len(problems) == 4
+    assert not check_for_valid_tags({"ENCUT": 520, "FOO": 1})
+
+    try:
+        validate_incar_dict({"ISMEAR": "0.5"})
+        assert False
+    except ValueError as error:
+        assert "ISMEAR" in str(error)
+
+
+def test_job_templates():
+    templates = {"_base": {"ENCUT": "520", "ISIF": "3", "NSW": "90"}, "_slab": {"ISIF": "2"},
+                 "slab": {"extends": ["_base", "_slab"], "nsw": "10"}, "loop": {"extends": "loop"}}
+
+    #test if later bases and the template itself override earlier bases, independent of case
+    assert resolve_template("slab", templates) == {"ENCUT": "520", "ISIF": "2", "NSW": "10"}
+
+    #test if circular inheritance is reported
+    try:
+        resolve_template("loop", templates)
+        assert False
+    except ValueError:
+        pass
+
+    #test if the relaxation templates only differ where their layers do
+    assert {key: value for key, value in job_types["slab_relaxation_high_prec"].items() if key not in ("ISIF", "SYSTEM")} == \
+           {key: value for key, value in job_types["bulk_relaxation_high_prec"].items() if key not in ("ISIF", "SYSTEM")}
+    assert job_types["slab_relaxation_low_prec"]["ISIF"] == "2" and job_types["bulk_relaxation_low_prec"]["NSW"] == "90"
@@ -0,0 +1,26 @@
+import pandas as pd
+
+from analysis import (E_adsorbate, E_slab, E_system, calc_E_adsorption, find_system,
+                      find_systems, load_data, make_adsorbate_dict)
+
+
+def test_calc_E_adsorption():
+    data = load_data("resources")
+    adsorbed_slabs = data["slabs_adsorbates"]
+
+    #test if the vectorized system labels match the row-wise ones
+    expected_systems = adsorbed_slabs.apply(find_system, axis=1)
+    assert list(find_systems(adsorbed_slabs["Directory"])) == list(expected_systems)
+
+    # row-wise reference implementation
+    reference = adsorbed_slabs.copy()
+    reference["System"] = expected_systems
+    adsorbates_dict = make_adsorbate_dict(data["adsorbates"])
+    E_sys = reference.apply(lambda x: E_system(reference, x['System'], x['Adsorbate']), axis=1)
+    E_slb = reference.apply(lambda x: E_slab(data["slabs"], x['System']), axis=1)
+    E_ads = reference.apply(lambda x: E_adsorbate(x['Adsorbate'], adsorbates_dict), axis=1)
+    reference['Adsorption Energy'] = (E_sys - E_slb - E_ads) * -1
+
+    #test if the join-based implementation gives identical results
+    result = calc_E_adsorption(data["slabs"], data["adsorbates"], adsorbed_slabs.copy())
+    pd.testing.assert_frame_equal(result, reference)
@@ -0,0 +1,62 @@
+import os
+import shutil
+
+from pymatgen.io.vasp.outputs import Vasprun
+
+from archive import ArchiveWriter, RunArchive, write_archive
+
+
+def test_archive(tmp_path):
+    run_dirs = [os.path.join(tmp_path, "Cu", name) for name in ("run_1", "run_2")]
+    for run_dir in run_dirs:
+        shutil.copytree("tests/vasp_run", run_dir)
+    filename = os.path.join(tmp_path, "runs.zip")
+
+    #test if runs are named by their relative path
+    assert write_archive(run_dirs, filename, workers=2) == ["Cu/run_1", "Cu/run_2"]
+
+    vasprun = Vasprun("tests/vasp_run/vasprun.xml")
+    with RunArchive(filename) as archive:
+        #test if the index has one row per run with the final energy
+        assert list(archive.index["name"]) == ["Cu/run_1", "Cu/run_2"]
+        assert archive.index["energy"][0] == vasprun.final_energy
+
+        #test if single quantities agree with a full parse
+        assert archive.structure("Cu/run_2") == vasprun.final_structure
+        assert archive.get("Cu/run_1", "eigenvalues").shape == (1, 8, 32, 2)
+        assert (archive.get("Cu/run_1", "dos")[0] == vasprun.complete_dos.energies).all()
+        assert len(archive.get("Cu/run_1", "ionic_steps")) == 2
+
+        #test if raw files can be read and extracted
+        with open("tests/vasp_run/INCAR") as f:
+            assert archive.read_file("Cu/run_1", "INCAR") == f.read()
+        assert len(archive.extract("Cu/run_1", os.path.join(tmp_path, "extracted"))) == 4
+
+    #test if runs can be appended but not repeated
+    with ArchiveWriter(filename, mode="a") as writer:
+        writer.add_run(run_dirs[0], name="extra", raw_files=["*"], parse=False)
+        try:
+            writer.add_run(run_dirs[0], name="extra")
+            assert False
+        except ValueError:
+            pass
+    with RunArchive(filename) as archive:
+        assert archive.meta("extra")["quantities"] == []
+        assert "vasprun.xml" in archive.meta("extra")["files"]
+
+
+def test_archive_running_job(tmp_path):
+    run_dirs = [os.path.join(tmp_path, "Cu", name) for name in ("done", "running")]
+    for run_dir in run_dirs:
+        shutil.copytree("tests/vasp_run", run_dir)
+    with open(os.path.join(run_dirs[1], "vasprun.xml"), "r+") as f:
+        f.truncate(len(f.read()) // 2)
+    filename = os.path.join(tmp_path, "runs.zip")
+
+    #test if a run that cannot be parsed is archived with its raw files and the error instead of stopping the archive
+    assert write_archive(run_dirs, filename, workers=2) == ["Cu/done", "Cu/running"]
+    with RunArchive(filename) as archive:
+        assert archive.meta("Cu/done")["error"] is None
+        assert archive.meta("Cu/running")["error"] is not None and archive.meta("Cu/running")["quantities"] == []
+        assert list(archive.index["error"].isna()) == [True, False]
+        assert "INCAR" in archive.meta("Cu/running")["files"]
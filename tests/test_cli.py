@@ -0,0 +1,56 @@
+import io
+import os
+import shutil
+import threading
+import time
+
+from pymatgen.core.structure import Structure
+
+from cli import expand_paths, main, run, serve
+
+
+def test_freeze_and_extend(tmp_path):
+    for name in ("POSCAR_1", "POSCAR_2"):
+        shutil.copy("tests/POSCAR", os.path.join(tmp_path, name))
+
+    #test if a glob freezes every file in one call
+    assert run(["freeze", os.path.join(tmp_path, "POSCAR_*"), "--min-z", "1"]) == 0
+    frozen = Structure.from_file(os.path.join(tmp_path, "POSCAR_1_frozen"))
+    assert "selective_dynamics" in frozen.site_properties
+
+    #test if extend writes supercells and missing files are reported without stopping the batch
+    paths = io.StringIO(os.path.join(tmp_path, "POSCAR_1") + "\n" + os.path.join(tmp_path, "missing") + "\n")
+    assert run(["extend", "-", "-x", "2", "-y", "2"], paths) == 1
+    extended = Structure.from_file(os.path.join(tmp_path, "POSCAR_1_extended"))
+    assert len(extended) == 4 * len(Structure.from_file("tests/POSCAR"))
+
+
+def test_write_inputs(tmp_path):
+    manifest = os.path.join(tmp_path, "structures.txt")
+    with open(manifest, "w") as f:
+        f.write("# structures to run\ntests/POSCAR\n\ntests/vasp_run/POSCAR\ntests/POSCAR\n")
+
+    #test if paths are read from a manifest, duplicates are dropped
+    assert expand_paths([], manifest) == ["tests/POSCAR", "tests/vasp_run/POSCAR"]
+
+    output = os.path.join(tmp_path, "manifest.csv")
+    assert run(["write-inputs", "--manifest", manifest, "--job-type", "dos", "--save-dir", str(tmp_path), "--output", output]) == 0
+    with open(output) as f:
+        assert len(f.read().splitlines()) == 3
+    assert os.path.exists(os.path.join(tmp_path, "Cu_dos", "INCAR"))
+
+
+def test_serve(tmp_path, capsys):
+    socket_path = os.path.join(tmp_path, "autovasp.sock")
+    shutil.copy("tests/POSCAR", os.path.join(tmp_path, "POSCAR"))
+
+    #test if commands fall back to running locally without a worker
+    assert main(["--socket", socket_path, "freeze", os.path.join(tmp_path, "POSCAR"), "--min-z", "1"]) == 0
+    assert "running locally" in capsys.readouterr().err
+
+    #test if a worker runs the command and returns its output
+    threading.Thread(target=serve, args=(socket_path,), daemon=True).start()
+    while not os.path.exists(socket_path):
+        time.sleep(0.01)
+    assert main(["--socket", socket_path, "extend", os.path.join(tmp_path, "POSCAR"), "-x", "1", "-y", "1"]) == 0
+    assert capsys.readouterr().out.strip() == os.path.join(tmp_path, "POSCAR_extended")
@@ -0,0 +1,41 @@
+import numpy as np
+from pymatgen.core.structure import Structure
+
+from AutoVASP import JobMatrix, job_types, vaspInput
+from cost import calibrate_band_multiple, count_electrons, default_nbands, estimate_cost, plane_wave_count, recommend_parallelization
+
+
+def test_estimate_cost():
+    structure = Structure.from_file("bs_bulk.vasp")
+    job = vaspInput(structure, job_types["bulk_relaxation_med_prec"])
+
+    #test if NELECT is the sum of the ZVALs (Bi_d 15, Se 6)
+    assert count_electrons(structure, job.potcar) == 6 * 15 + 9 * 6
+
+    #test if the default NBANDS reproduces the recorded Bi2Se3 slabs (30 atoms, 288 electrons, 192 bands, 384 with soc)
+    assert default_nbands(288, 30, band_multiple=64) == 192
+    assert default_nbands(288, 30, noncollinear=True, band_multiple=64) == 384
+    assert max(calibrate_band_multiple(), key=calibrate_band_multiple().get) == 64
+
+    #test if the plane waves scale with the volume and ENCUT^(3/2)
+    assert abs(plane_wave_count(4 * 520, 100) / plane_wave_count(520, 100) - 8) < 1e-2
+    assert abs(plane_wave_count(520, 200) / plane_wave_count(520, 100) - 2) < 1e-2
+
+    #test if spin-orbit coupling doubles the bands and the spinor components
+    collinear = estimate_cost(30, 288, 1000, 520, 10)
+    noncollinear = estimate_cost(30, 288, 1000, 520, 10, soc=True)
+    assert noncollinear["nbands"] == 2 * collinear["nbands"]
+    assert noncollinear["memory_gb"] > 3.9 * collinear["memory_gb"]
+
+    #test if KPAR never exceeds the k-points and KPAR * cores per group is the core count
+    parallelization = recommend_parallelization(n_kpoints=5, nbands=192, cores=128)
+    assert parallelization["kpar"] == 4
+    assert 128 // parallelization["kpar"] % parallelization["ncore"] == 0
+
+    #test if the job matrix gets one cost estimate per job
+    df = JobMatrix([job, vaspInput(structure, job_types["spin_orbit"])]).df
+    assert {"memory_gb", "relative_core_hours", "kpar", "ncore"} <= set(df.columns)
+    assert np.all(df["memory_gb"] > 0)
+
+    #test if spin-orbit coupling without symmetry (ISYM = -1) uses every point of the mesh
+    assert df["n_irreducible"][1] == np.prod(df[["k_x", "k_y", "k_z"]].iloc[1])
@@ -0,0 +1,58 @@
+import os
+import shutil
+
+import pandas as pd
+
+import harvest as harvest_module
+from AutoVASP import vaspOutput
+from harvest import find_run_directories, harvest
+
+
+def test_harvest(tmp_path):
+    # build a small campaign tree with one good and one broken run
+    good_dir = os.path.join(tmp_path, "Cu", "good")
+    bad_dir = os.path.join(tmp_path, "Cu", "bad")
+    shutil.copytree("tests/vasp_run", good_dir)
+    shutil.copytree("tests/vasp_run", bad_dir)
+    with open(os.path.join(bad_dir, "vasprun.xml"), "w") as f:
+        f.write("<modeling>")
+
+    #test if both run directories are found
+    assert find_run_directories(str(tmp_path)) == [bad_dir, good_dir]
+
+    #test if a broken directory is reported without stopping the harvest
+    df = harvest(str(tmp_path), workers=2)
+    assert isinstance(df, pd.DataFrame)
+    assert list(df["directory"]) == [good_dir]
+    assert list(df.attrs["failures"]) == [bad_dir]
+
+    #test if the columns match a single vaspOutput
+    expected = vaspOutput(good_dir).results_dataframe()
+    assert list(df.columns) == ["directory"] + list(expected.columns)
+    assert df["energy"][0] == expected["energy"][0]
+
+
+def test_harvest_cache(tmp_path, monkeypatch):
+    run_dirs = [os.path.join(tmp_path, name) for name in ("run_1", "run_2")]
+    for run_dir in run_dirs:
+        shutil.copytree("tests/vasp_run", run_dir)
+
+    first = harvest(str(tmp_path), cache=True)
+    assert os.path.exists(os.path.join(tmp_path, harvest_module.cache_filename))
+
+    # count how many directories are parsed again
+    parsed = []
+    harvest_directory = harvest_module.harvest_directory
+    monkeypatch.setattr(harvest_module, "harvest_directory", lambda directory: parsed.append(directory) or harvest_directory(directory))
+
+    #test if unchanged runs are served from the cache
+    second = harvest(str(tmp_path), cache=True)
+    assert parsed == []
+    pd.testing.assert_frame_equal(first, second, check_dtype=False)
+
+    #test if a modified run is parsed again
+    with open(os.path.join(run_dirs[1], "CONTCAR"), "a") as f:
+        f.write("\n")
+    third = harvest(str(tmp_path), cache=True)
+    assert parsed == [run_dirs[1]]
+    assert list(third["directory"]) == run_dirs
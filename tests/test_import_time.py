@@ -0,0 +1,37 @@
+import os
+import subprocess
+import sys
+
+# modules that should only be imported when the functions that need them are called
+heavy_modules = ["pandas", "mp_api.client", "pymatgen.analysis.adsorption", "pymatgen.core.surface", "pymatgen.symmetry.bandstructure",
+                 "pymatgen.io.vasp", "pymatgen.io.vasp.outputs"]
+
+# limit on the cumulative import time of AutoVASP in seconds, about 0.25 s without pymatgen.io.vasp and 1.6 s with it
+max_import_time = 0.8
+
+
+def import_times(module: str) -> dict[str, float]:
+    '''
+    Runs python -X importtime in a fresh interpreter and returns the cumulative import time of every module in seconds
+    '''
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {module}"], capture_output=True, text=True,
+                            cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))), check=True)
+
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line.split("|")
+        times[name.strip()] = int(cumulative) / 1e6
+
+    return times
+
+
+def test_import_time():
+    times = import_times("AutoVASP")
+
+    #test if the heavy dependencies are not imported with AutoVASP
+    assert [module for module in heavy_modules if module in times] == []
+
+    #test if importing AutoVASP stays fast
+    assert times["AutoVASP"] < max_import_time
@@ -0,0 +1,94 @@
+import os
+import shutil
+
+from cli import run
+from outcar import job_state, read_outcar_header, read_reverse_lines, scan_jobs
+
+outcar_file = "tests/vasp_run/OUTCAR"
+
+
+def test_read_reverse_lines():
+    with open(outcar_file, "rb") as f:
+        lines = f.read().split(b"\n")
+
+    #test if small blocks give the same lines as a forward read
+    assert list(read_reverse_lines(outcar_file, block_size=100)) == lines[::-1]
+
+
+def test_job_state():
+    #test if the header and the final energy are read
+    assert read_outcar_header(outcar_file) == {"nions": 4, "nelect": 44.0, "nbands": 32, "nkpts": 8, "nsw": 90, "ibrion": 2}
+    state = job_state("tests/vasp_run", block_size=256)
+    assert state["status"] == "converged"
+    assert state["energy"] == -14.91873035
+
+
+def test_scan_jobs(tmp_path, capsys):
+    with open(outcar_file, "r") as f:
+        lines = f.read().splitlines(keepends=True)
+    converged_line = next(i for i, line in enumerate(lines) if "reached required accuracy" in line)
+
+    jobs = {"converged": lines, "running": lines[:converged_line - 20], "failed": lines[:converged_line] + lines[converged_line + 1:], "not started": None}
+    for name, job_lines in jobs.items():
+        os.makedirs(os.path.join(tmp_path, name))
+        shutil.copy("tests/vasp_run/INCAR", os.path.join(tmp_path, name, "INCAR"))
+        if job_lines is not None:
+            with open(os.path.join(tmp_path, name, "OUTCAR"), "w") as f:
+                f.writelines(job_lines)
+
+    #test if every job gets the right status
+    df = scan_jobs(str(tmp_path), workers=2)
+    assert dict(zip(df["directory"].map(os.path.basename), df["status"])) == {name: name for name in jobs}
+    #test if a running job reports the energy of the last electronic step written so far
+    assert df.loc[df["status"] == "running", "energy"].iloc[0] == -14.91873035
+
+    #test if a finished static run is converged but left out of the relaxations
+    static = [line.replace("NSW    =     90", "NSW    =      0") for line in lines[:converged_line] + lines[converged_line + 1:]]
+    os.makedirs(os.path.join(tmp_path, "static"))
+    with open(os.path.join(tmp_path, "static", "OUTCAR"), "w") as f:
+        f.writelines(static)
+    assert job_state(os.path.join(tmp_path, "static"))["status"] == "converged"
+    assert run(["status", str(tmp_path), "--status", "converged", "--relaxation-only", "--paths"]) == 0
+    assert capsys.readouterr().out == os.path.join(str(tmp_path), "converged") + "\n"
+
+    #test if an unfinished job that stopped writing is failed
+    stale = job_state(os.path.join(tmp_path, "running"), stale_after=-1)
+    assert stale["status"] == "failed"
+
+
+def test_outcar_stream(tmp_path):
+    from outcar import OutcarStream, relaxation_stalled
+    from pymatgen.io.vasp.outputs import Outcar
+
+    #test if the steps agree with a full pymatgen parse
+    steps = OutcarStream(outcar_file).read()
+    assert list(steps["step"]) == [1, 2]
+    assert steps["energy_sigma_0"][-1] == Outcar(outcar_file).final_energy
+    assert steps["drift"].tolist() == Outcar(outcar_file).drift
+
+    #test if a file that is still being written is read incrementally and can be resumed from the saved offset
+    with open(outcar_file, "rb") as f:
+        data = f.read()
+    partial = os.path.join(tmp_path, "OUTCAR")
+    split = data.index(b"Iteration      2(   2)") + 10
+    with open(partial, "wb") as f:
+        f.write(data[:split])
+    stream = OutcarStream(partial)
+    first = stream.read()
+    with open(partial, "ab") as f:
+        f.write(data[split:])
+    rest = OutcarStream(partial, stream.offset, stream.step).read()
+    assert len(first) == 1 and len(rest) == 1
+    assert (rest == steps[1:]).all() and (stream.read() == steps[1:]).all()
+    assert stream.finished
+
+    #test if an OUTCAR truncated by a restarted job is read again from the start
+    with open(partial, "wb") as f:
+        f.write(data[:split])
+    assert list(stream.read()["step"]) == [1] and not stream.finished
+
+    #test if follow stops at the end of the job and large drifts are reported
+    assert len(list(OutcarStream(outcar_file).follow(interval=0))) == 2
+    assert relaxation_stalled(steps) is None
+    steps["drift"][-1] = [-20.66, 0, 0]
+    assert "drift" in relaxation_stalled(steps)
@@ -0,0 +1,78 @@
+import os
+
+from pymatgen.core.structure import Structure
+
+from AutoVASP import freeze_structure, vaspInput, write_job_batch, write_job_files
+from store import StructureStore
+
+
+def test_StructureStore(tmp_path):
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    store = StructureStore(os.path.join(tmp_path, "structures.sqlite"))
+
+    #test if the first job owns the structure and a reordered copy is found as a duplicate
+    assert store.register(test_structure, "job_1", tag="dos") == "job_1"
+    assert store.lookup(Structure.from_sites(test_structure.sites[::-1]), tag="dos") == "job_1"
+    assert store.register(test_structure.copy(), "job_2", tag="dos") == "job_1"
+
+    #test if the same structure with another job type is not a duplicate
+    assert store.lookup(test_structure, tag="band") is None
+
+    #test if a slightly strained copy only matches at the StructureMatcher level
+    strained = test_structure.copy()
+    strained.scale_lattice(test_structure.volume * 1.01)
+    assert store.lookup(strained, tag="dos") is None
+    assert StructureStore(store.filename, match=True).lookup(strained, tag="dos") == "job_1"
+    assert len(store) == 1
+
+
+def test_write_job_files_store(tmp_path):
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    store = StructureStore(os.path.join(tmp_path, "structures.sqlite"))
+    first, second, third = (os.path.join(tmp_path, name) for name in ("first", "second", "third"))
+
+    #test if a duplicate job is skipped or aliased instead of written again
+    assert write_job_files(test_structure, "dos", first, store=store) == first
+    assert write_job_files(test_structure, "dos", second, store=store) == first
+    assert not os.path.exists(second)
+    write_job_files(test_structure, "dos", third, store=store, duplicates="alias")
+    assert os.path.islink(third) and os.path.samefile(third, first)
+
+    #test if the alias directory's parent is created
+    nested = os.path.join(tmp_path, "aliases", "dos")
+    write_job_files(test_structure, "dos", nested, store=store, duplicates="alias")
+    assert os.path.islink(nested) and os.path.samefile(nested, first)
+
+    #test if a frozen copy of the same geometry is not a duplicate
+    frozen = freeze_structure(test_structure.copy(), 1.0)
+    assert write_job_files(frozen, "dos", os.path.join(tmp_path, "frozen"), store=store) == os.path.join(tmp_path, "frozen")
+
+    #test if the batch writer reports duplicates in its manifest
+    jobs = [(test_structure, "dos", os.path.join(tmp_path, "batch")), (test_structure, "band", os.path.join(tmp_path, "band"))]
+    manifest = write_job_batch(jobs, store=store)
+    assert list(manifest["status"]) == ["duplicate", "written"]
+    assert manifest["duplicate_of"][0] == first
+
+
+def test_write_job_files_store_failure(tmp_path, monkeypatch):
+    test_structure: Structure = Structure.from_file("tests/POSCAR")
+    store = StructureStore(os.path.join(tmp_path, "structures.sqlite"))
+    failed, retry = os.path.join(tmp_path, "failed"), os.path.join(tmp_path, "retry")
+
+    #test if an unknown job type fails before anything is registered
+    try:
+        write_job_files(test_structure, "unknown", failed, store=store)
+        assert False
+    except KeyError:
+        assert len(store) == 0
+
+    #test if a failed write releases the structure so the next identical job is written
+    def fail(*args, **kwargs):
+        raise OSError("disk full")
+
+    monkeypatch.setattr(vaspInput, "write_input_files", fail)
+    manifest = write_job_batch([(test_structure, "dos", failed)], store=store)
+    assert list(manifest["status"]) == ["failed"] and len(store) == 0
+    monkeypatch.undo()
+    manifest = write_job_batch([(test_structure, "dos", retry)], store=store)
+    assert list(manifest["status"]) == ["written"] and store.lookup(test_structure, tag="dos") == os.path.abspath(retry)
@@ -0,0 +1,41 @@
+from pymatgen.core.structure import Structure
+
+from AutoVASP import get_symmetry_info, job_types, laue_group_order, vaspInput
+from symmetry import SymmetryCache, symmetry_cache, symmetry_info
+
+
+def test_symmetry_cache():
+    structure = Structure.from_file("tests/POSCAR")
+    slab = Structure.from_file("bs_bulk.vasp")
+    symmetry_cache.clear()
+
+    #test if the cached result matches pymatgen and is reused for the same structure in a different site order
+    info = symmetry_info(structure)
+    assert info.space_group_info == structure.get_space_group_info()
+    assert symmetry_info(Structure.from_sites(structure.sites[::-1])) is info
+    assert get_symmetry_info(structure) == "cubic" and symmetry_cache.misses == 1
+
+    #test if the primitive and conventional cells are available and changing them does not change the cache
+    assert len(info.primitive) == 1 and len(info.conventional) == len(structure)
+    info.conventional.make_supercell([2, 1, 1])
+    info.primitive.add_site_property("magmom", [1.0])
+    assert len(info.conventional) == len(structure) and "magmom" not in info.primitive.site_properties
+
+    #test if laue_group_order shares the analysis of the default tolerance
+    misses = symmetry_cache.misses
+    assert laue_group_order(structure) == 48 and symmetry_cache.misses == misses
+
+    #test if the tolerance is part of the key
+    assert symmetry_info(structure, symprec=0.1) is not info
+
+    #test if vaspInput shares the cached analysis
+    job = vaspInput(slab, job_types["bulk_relaxation_med_prec"])
+    hits = symmetry_cache.hits
+    assert job.as_dataframe()["intl_number"][0] == symmetry_info(slab).number
+    assert symmetry_cache.hits == hits + 1
+
+    #test if the least recently used result is evicted
+    cache = SymmetryCache(maxsize=1)
+    first = cache.get(structure)
+    cache.get(slab)
+    assert len(cache) == 1 and cache.get(structure) is not first
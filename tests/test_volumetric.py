@@ -0,0 +1,38 @@
+import os
+
+import numpy as np
+from pymatgen.io.vasp.inputs import Poscar
+from pymatgen.io.vasp.outputs import Chgcar
+
+from volumetric import VolumetricGrid
+
+
+def test_VolumetricGrid(tmp_path):
+    # write a small CHGCAR with pymatgen and read it back
+    filename = os.path.join(tmp_path, "CHGCAR")
+    data = np.random.default_rng(0).random((6, 5, 8))
+    Chgcar(Poscar.from_file("tests/POSCAR"), {"total": data}).write_file(filename)
+    reference = Chgcar.from_file(filename).data["total"]
+
+    grid = VolumetricGrid(filename)
+    assert grid.shape == (6, 5, 8)
+    assert len(grid.structure) == 4
+
+    #test if planes are read without loading the whole grid
+    assert np.allclose(grid.read_planes(2, 5), reference[:, :, 2:5])
+    assert np.allclose(grid.get_slice(2, 7), reference[:, :, 7])
+    assert np.allclose(grid.get_slice(2, -1), reference[:, :, -1])
+    assert np.allclose(grid.get_subvolume(slice(1, 3), slice(None), slice(1, 8, 2)), reference[1:3, :, 1:8:2])
+    assert np.allclose(grid.planar_average(chunk_size=3), reference.mean(axis=(0, 1)))
+    assert "data" not in grid.__dict__
+
+    #test if the full grid matches pymatgen
+    assert np.allclose(grid.data, reference)
+    assert np.allclose(grid.planar_average(axis=0), reference.mean(axis=(1, 2)))
+
+    #test if a saved sidecar is used on the next open
+    grid.save_sidecar()
+    reopened = VolumetricGrid(filename)
+    assert reopened.has_sidecar()
+    assert isinstance(reopened.data, np.memmap)
+    assert np.allclose(reopened.data, reference)
@@ -0,0 +1,172 @@
+from __future__ import annotations
+
+import mmap
+import os
+from functools import cached_property
+from typing import Union
+
+import numpy as np
+from pymatgen.core.structure import Structure
+
+
+class VolumetricGrid:
+    '''
+    Reads the first (total) data block of a CHGCAR, ELFCAR, LOCPOT or similar file without a full pymatgen parse
+    The file is indexed once, z-planes are read straight from a memory map and the full grid can be saved as a .npy sidecar
+    Values are returned exactly as written in the file (for CHGCAR this is the density multiplied by the cell volume)
+    '''
+
+    def __init__(self, filename: str, use_sidecar: bool = True) -> None:
+        self.filename = filename
+        self.sidecar = filename + ".npy"
+        self.use_sidecar = use_sidecar
+        self.header: str
+        self.shape: tuple[int, int, int]
+        self.data_offset: int
+        self.values_per_line: int
+        self.line_length: Union[int, None]
+        self.index_file()
+
+    def index_file(self) -> None:
+        '''
+        Finds the grid dimensions, the byte offset of the data block and the layout of the data lines
+        '''
+        with open(self.filename, "rb") as f:
+            header_lines = [f.readline() for _ in range(6)]
+            # VASP 5 files have a line of element symbols before the counts
+            if not all(token.isdigit() for token in header_lines[5].split()):
+                header_lines.append(f.readline())
+            n_sites = sum(int(token) for token in header_lines[-1].split())
+            coordinate_line = f.readline()
+            header_lines.append(coordinate_line)
+            if coordinate_line.strip().lower().startswith(b"s"):
+                header_lines.append(f.readline())
+            header_lines.extend(f.readline() for _ in range(n_sites))
+
+            line = f.readline()
+            while line and len(line.split()) != 3:
+                line = f.readline()
+            if not line:
+                raise ValueError(f"No grid dimensions found in {self.filename}")
+
+            self.header = b"".join(header_lines).decode()
+            self.shape = tuple(int(n) for n in line.split())  # type: ignore
+            self.data_offset = f.tell()
+
+            first_line = f.readline()
+            second_line = f.readline()
+
+        self.values_per_line = len(first_line.split())
+        n_values = int(np.prod(self.shape))
+        n_full_lines = n_values // self.values_per_line
+        self.line_length = None
+        # planes can only be located directly if every data line has the same width
+        if len(first_line) == len(second_line) or n_full_lines == 1:
+            with open(self.filename, "rb") as f:
+                f.seek(self.data_offset + n_full_lines * len(first_line) - 1)
+                if f.read(1) == b"\n":
+                    self.line_length = len(first_line)
+
+    @classmethod
+    def from_file(cls, filename: str, use_sidecar: bool = True) -> VolumetricGrid:
+        return cls(filename, use_sidecar=use_sidecar)
+
+    @cached_property
+    def structure(self) -> Structure:
+        from pymatgen.io.vasp.inputs import Poscar
+
+        return Poscar.from_str(self.header).structure
+
+    def has_sidecar(self) -> bool:
+        '''
+        Checks if a .npy sidecar exists that is newer than the text file
+        '''
+        return os.path.exists(self.sidecar) and os.path.getmtime(self.sidecar) >= os.path.getmtime(self.filename)
+
+    @cached_property
+    def data(self) -> np.ndarray:
+        '''
+        The full grid with shape (NGX, NGY, NGZ)
+        A sidecar is opened as a read-only memory map
+        '''
+        if self.use_sidecar and self.has_sidecar():
+            data = np.load(self.sidecar, mmap_mode="r")
+            if data.shape == self.shape:
+                return data
+
+        with open(self.filename, "rb") as f:
+            f.seek(self.data_offset)
+            values = np.fromfile(f, dtype=float, count=int(np.prod(self.shape)), sep=" ")
+
+        return values.reshape(self.shape, order="F")
+
+    def save_sidecar(self, dtype: type = np.float64) -> str:
+        '''
+        Saves the grid as a .npy file next to the text file so later opens can skip the text parse
+        '''
+        np.save(self.sidecar, np.ascontiguousarray(self.data, dtype=dtype))
+
+        return self.sidecar
+
+    def read_planes(self, z_start: int, z_stop: int) -> np.ndarray:
+        '''
+        Returns the sub-volume data[:, :, z_start:z_stop] reading only the lines that hold those planes
+        '''
+        nx, ny, nz = self.shape
+        z_start, z_stop, _ = slice(z_start, z_stop).indices(nz)
+        if z_stop <= z_start:
+            return np.empty((nx, ny, 0))
+
+        if "data" in self.__dict__ or self.line_length is None or (self.use_sidecar and self.has_sidecar()):
+            return np.asarray(self.data[:, :, z_start:z_stop])
+
+        first_value = z_start * nx * ny
+        last_value = z_stop * nx * ny
+        first_line = first_value // self.values_per_line
+        last_line = (last_value - 1) // self.values_per_line
+
+        with open(self.filename, "rb") as f:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                start = self.data_offset + first_line * self.line_length
+                stop = self.data_offset + (last_line + 1) * self.line_length
+                values = np.array(mm[start:stop].split(), dtype=float)
+
+        offset = first_value - first_line * self.values_per_line
+        values = values[offset:offset + last_value - first_value]
+
+        return values.reshape((nx, ny, z_stop - z_start), order="F")
+
+    def get_slice(self, axis: int, index: int) -> np.ndarray:
+        '''
+        Returns a single plane of the grid perpendicular to axis, negative indices count from the end as in numpy
+        '''
+        if not -self.shape[axis] <= index < self.shape[axis]:
+            raise IndexError(f"index {index} is out of bounds for axis {axis} with size {self.shape[axis]}")
+        index %= self.shape[axis]
+
+        if axis == 2:
+            return self.read_planes(index, index + 1)[:, :, 0]
+
+        return np.asarray(np.take(self.data, index, axis=axis))
+
+    def get_subvolume(self, x: slice = slice(None), y: slice = slice(None), z: slice = slice(None)) -> np.ndarray:
+        '''
+        Returns data[x, y, z], only the requested z-planes are read from the text file
+        '''
+        z_start, z_stop, z_step = z.indices(self.shape[2])
+
+        return self.read_planes(z_start, z_stop)[x, y, ::z_step]
+
+    def planar_average(self, axis: int = 2, chunk_size: int = 16) -> np.ndarray:
+        '''
+        Returns the average of each plane along axis
+        Along z the planes are read in chunks so the full grid is never held in memory
+        '''
+        if axis != 2:
+            other_axes = tuple(i for i in range(3) if i != axis)
+            return np.asarray(self.data.mean(axis=other_axes))
+
+        nz = self.shape[2]
+        averages = [self.read_planes(z, min(z + chunk_size, nz)).mean(axis=(0, 1)) for z in range(0, nz, chunk_size)]
+
+        return np.concatenate(averages)